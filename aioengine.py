@@ -0,0 +1,313 @@
+"""
+asyncio HTTP 引擎（基于 httpx，主机支持时使用 HTTP/2）
+- 所有会话共用同一个连接池传输层，HTTP/2 下同一主机的请求在一条连接上多路复用
+- 全局在途请求上限由 HTTP_MAX_INFLIGHT 配置；熔断、整次运行截止时间与同步客户端一致
+- 对冲请求（hedge.py）在事件循环内进行，落败的一份直接取消
+- 与同步客户端共用磁盘缓存与条件请求（httpcache.py）
+- 每个账号通过 engine.session() 获得独立的 cookies 与请求头
+- 引擎在后台线程中运行事件循环；SyncSession 为现有同步脚本提供 requests 风格接口，
+  设置 HTTP_ENGINE=asyncio 后 client.new_session() 即返回 SyncSession，定时任务无需修改
+- 已改写为协程的账号流程（emqd、ikuuu）由 run_all() 在同一事件循环上以 asyncio.gather 并发，
+  同时进行的账号数由 SIGN_ASYNC_CONCURRENCY 限制，不占用工作线程；get() 为 client.get() 的协程版本
+注意：其余站点流程仍是同步代码，经 SyncSession 使用时每个账号仍占用 runner 的一个工作线程
+（线程阻塞等待事件循环中的请求完成），即仅替换为 HTTP/2 多路复用的传输层，并发账号数仍受 SIGN_WORKERS 限制
+"""
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from urllib.parse import urlparse
+
+import httpx
+
+import client
+import hedge
+import httpcache
+import breaker
+import ratelimit
+
+logger = logging.getLogger(__name__)
+
+MAX_INFLIGHT = int(os.environ.get('HTTP_MAX_INFLIGHT', '64'))
+# run_all() 同时进行的账号数
+ACCOUNT_CONCURRENCY = int(os.environ.get('SIGN_ASYNC_CONCURRENCY', '32'))
+
+
+def _timeout(value):
+    """将 requests 风格的超时（秒数或 (连接, 读取) 元组）转换为 httpx.Timeout"""
+    if value is None:
+        value = client.DEFAULT_TIMEOUT
+    if isinstance(value, tuple):
+        connect, read = value
+        return httpx.Timeout(read, connect=connect)
+    return httpx.Timeout(value)
+
+
+class _SharedTransport(httpx.AsyncBaseTransport):
+    """各会话共用的传输层，单个会话关闭时不关闭连接池"""
+
+    def __init__(self, transport):
+        self.transport = transport
+
+    async def handle_async_request(self, request):
+        return await self.transport.handle_async_request(request)
+
+    async def aclose(self):
+        pass
+
+
+class AsyncSession:
+    """单个账号的异步会话，接口与 requests.Session 保持一致"""
+
+    def __init__(self, engine, user_agent=client.DESKTOP_UA, headers=None):
+        self.engine = engine
+        self._client = httpx.AsyncClient(
+            transport=engine.transport,
+            headers={'User-Agent': user_agent, **(headers or {})},
+            follow_redirects=True,
+        )
+
+    @property
+    def headers(self):
+        return self._client.headers
+
+    @property
+    def cookies(self):
+        return self._client.cookies
+
+    async def request(self, method, url, params=None, data=None, json=None, headers=None,
+                      cookies=None, timeout=None, allow_redirects=True, **kwargs):
+        if cookies:
+            self._client.cookies.update(cookies)
+        return await self.engine.send(
+            self._client, method, url,
+            params=params, data=data, json=json, headers=headers,
+            timeout=_timeout(client.clamp_timeout(timeout)), follow_redirects=allow_redirects,
+        )
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+    async def _timed_get(self, key, url, **kwargs):
+        start = time.monotonic()
+        response = await self.get(url, **kwargs)
+        hedge.tracker.record(key, time.monotonic() - start)
+        return response
+
+    async def hedged_get(self, url, key, hedge_after, **kwargs):
+        """超过 hedge_after 秒未返回且预算允许时发出对冲请求，先成功者返回，另一份取消"""
+        primary = asyncio.ensure_future(self._timed_get(key, url, **kwargs))
+        done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+        if done or not hedge.budget.take():
+            return await primary
+
+        hedge.stats['hedged'] += 1
+        backup = asyncio.ensure_future(self._timed_get(key, url, **kwargs))
+        pending = {primary, backup}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is backup:
+                        hedge.stats['hedge_won'] += 1
+                    for loser in pending:
+                        loser.cancel()
+                    return task.result()
+        return primary.result()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.aclose()
+
+
+class SyncSession:
+    """在引擎事件循环上执行请求的同步包装（调用线程阻塞至请求完成）"""
+
+    def __init__(self, engine, user_agent=client.DESKTOP_UA, headers=None):
+        self.engine = engine
+        self._session = engine.call(self._create(engine, user_agent, headers))
+
+    @staticmethod
+    async def _create(engine, user_agent, headers):
+        return AsyncSession(engine, user_agent, headers)
+
+    @property
+    def headers(self):
+        return self._session.headers
+
+    @property
+    def cookies(self):
+        return self._session.cookies
+
+    def request(self, method, url, **kwargs):
+        coro = self._session.request(method, url, **kwargs)
+        sent = ratelimit.exemption()
+        if sent is not None:
+            # 限速豁免记录在调用线程的上下文中，需带到事件循环上的任务里
+            coro = self._unthrottled(coro, sent)
+        return self.engine.call(coro)
+
+    @staticmethod
+    async def _unthrottled(coro, sent):
+        with ratelimit.unthrottled(sent):
+            return await coro
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def hedged_get(self, url, key, hedge_after, **kwargs):
+        return self.engine.call(self._session.hedged_get(url, key, hedge_after, **kwargs))
+
+    def close(self):
+        self.engine.call(self._session.aclose())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class Engine:
+    """后台事件循环 + 共享 HTTP/2 连接池 + 全局在途请求上限"""
+
+    def __init__(self, max_inflight=MAX_INFLIGHT):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='aioengine', daemon=True)
+        self.thread.start()
+        self.transport = _SharedTransport(httpx.AsyncHTTPTransport(
+            http2=True,
+            limits=httpx.Limits(max_connections=max_inflight, max_keepalive_connections=client.POOL_MAXSIZE),
+        ))
+        self.inflight = self.call(self._semaphore(max_inflight))
+
+    @staticmethod
+    async def _semaphore(value):
+        return asyncio.Semaphore(value)
+
+    def call(self, coro):
+        """在引擎事件循环中执行协程并同步等待结果"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def session(self, user_agent=client.DESKTOP_UA, headers=None):
+        """创建异步会话（需在引擎事件循环中调用）"""
+        return AsyncSession(self, user_agent, headers)
+
+    def sync_session(self, user_agent=client.DESKTOP_UA, headers=None):
+        return SyncSession(self, user_agent, headers)
+
+    async def send(self, http_client, method, url, **kwargs):
+        """按缓存策略发送请求：新鲜的缓存直接返回，否则带上校验信息，304 时使用缓存内容"""
+        # 带 params 的请求最终 URL 由 httpx 拼接，不参与缓存
+        cacheable = not kwargs.get('params')
+        entry = httpcache.cache.lookup(method, url) if cacheable else None
+        if entry:
+            if httpcache.cache.fresh(entry):
+                return httpx.Response(
+                    entry['status'], headers=dict(entry['headers']), content=httpcache.cache.hit(entry),
+                    request=http_client.build_request(method, url),
+                )
+            kwargs['headers'] = {**(kwargs.get('headers') or {}), **httpcache.cache.validators(entry)}
+
+        response = await self._send(http_client, method, url, **kwargs)
+        if entry and response.status_code == 304:
+            status, headers, body = httpcache.cache.revalidated(entry, response.headers)
+            return httpx.Response(status, headers=headers, content=body, request=response.request)
+        if cacheable:
+            httpcache.cache.store(method, url, response.status_code, response.headers, response.content)
+        return response
+
+    async def _send(self, http_client, method, url, **kwargs):
+        """经过限速与在途上限后发送请求，并向限速器反馈结果"""
+        host = urlparse(url).hostname
+        breaker.breaker.check(host)
+        wait = ratelimit.reserve(host)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        async with self.inflight:
+            client.stats[host] += 1
+            start = time.monotonic()
+            try:
+                response = await http_client.request(method, url, **kwargs)
+            except Exception:
+                ratelimit.limiter.feedback(host, None, time.monotonic() - start)
+                breaker.breaker.record(host, False)
+                raise
+        breaker.breaker.record(host, not breaker.is_failure(response.status_code))
+        text = ''
+        if 'html' in response.headers.get('Content-Type', ''):
+            text = response.content[:ratelimit.ANTI_BOT_SCAN_BYTES].decode('utf-8', 'ignore')
+        ratelimit.limiter.feedback(
+            host, response.status_code, time.monotonic() - start, text, ratelimit.retry_after(response)
+        )
+        return response
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def engine():
+    """进程内唯一的引擎实例（按需启动）"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = Engine()
+        return _engine
+
+
+async def _hedged_get(session, url, **kwargs):
+    """与 hedge.fetch() 相同的对冲延迟与预算"""
+    key = hedge.endpoint(url)
+    hedge.budget.count()
+    return await session.hedged_get(url, key, hedge.delay(key), **kwargs)
+
+
+async def get(session, url, phase='info', retries=client.GET_RETRIES, hedge=False, **kwargs):
+    """client.get() 的协程版本：网络错误或 5xx 时退避重试，hedge=True 时开启对冲请求"""
+    kwargs.setdefault('timeout', client.timeout(phase))
+    for attempt in range(retries + 1):
+        last = attempt == retries
+        try:
+            send = _hedged_get(session, url, **kwargs) if hedge else session.get(url, **kwargs)
+            response = await send
+            if last or response.status_code not in client.RETRY_STATUS:
+                return response
+        except Exception as e:
+            if last or not client._is_transient(e):
+                raise
+        delay = client.BACKOFF_BASE * 2 ** attempt * random.uniform(0.5, 1.5)
+        if delay >= client.remaining():
+            raise client.DeadlineExceeded(f"剩余运行时间不足，放弃重试 {url}")
+        await asyncio.sleep(delay)
+
+
+def run_all(func, items, concurrency=None):
+    """在引擎事件循环上并发执行协程函数 func(*item)，返回与 items 顺序一致的结果列表"""
+    items = list(items)
+    if not items:
+        return []
+    return engine().call(_gather(func, items, concurrency or ACCOUNT_CONCURRENCY))
+
+
+async def _gather(func, items, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(item):
+        async with semaphore:
+            return await func(*item)
+
+    return await asyncio.gather(*(run(item) for item in items))
@@ -0,0 +1,90 @@
+"""
+按主机的熔断器（状态跨运行保存）
+连续失败达到阈值后熔断，冷却期内对该主机的请求立即失败而不再发出；
+冷却结束后放行一次试探请求，成功则恢复，失败则加倍冷却时间重新熔断
+"""
+import os
+import time
+import atexit
+import logging
+import threading
+
+import requests
+
+import store
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE = store.state_path('circuits.json')
+
+FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_FAILURES', '3'))
+# 首次熔断的冷却时间（秒），之后每次试探失败加倍，最长 MAX_COOLDOWN
+COOLDOWN = float(os.environ.get('CIRCUIT_COOLDOWN', '600'))
+MAX_COOLDOWN = 6 * 3600
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """主机处于熔断状态，请求未发出"""
+
+
+class CircuitBreaker:
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+        self.circuits = store.load_json(path)
+        self.changed = set()
+        self.probing = set()
+        self.lock = threading.Lock()
+        atexit.register(self.save)
+
+    def check(self, host):
+        """请求前检查；熔断中直接抛出 CircuitOpenError，冷却结束时只放行一个试探请求"""
+        with self.lock:
+            circuit = self.circuits.get(host)
+            if not circuit or not circuit.get('open_until'):
+                return
+            remaining = circuit['open_until'] - time.time()
+            if remaining <= 0 and host not in self.probing:
+                self.probing.add(host)
+                return
+        raise CircuitOpenError(f"{host} 熔断中（{max(remaining, 0):.0f} 秒后重试）")
+
+    def record(self, host, ok):
+        """记录请求结果，更新熔断状态"""
+        with self.lock:
+            circuit = self.circuits.setdefault(host, {'failures': 0, 'open_until': 0, 'cooldown': COOLDOWN})
+            probing = host in self.probing
+            self.probing.discard(host)
+            if ok:
+                if circuit['failures'] or circuit['open_until']:
+                    if circuit['open_until']:
+                        logger.info(f"{host} 已恢复，解除熔断")
+                    circuit.update(failures=0, open_until=0, cooldown=COOLDOWN)
+                    self.changed.add(host)
+                return
+
+            circuit['failures'] += 1
+            if probing:
+                circuit['cooldown'] = min(MAX_COOLDOWN, circuit['cooldown'] * 2)
+            if probing or circuit['failures'] >= FAILURE_THRESHOLD:
+                circuit['open_until'] = time.time() + circuit['cooldown']
+                logger.warning(f"{host} 连续失败 {circuit['failures']} 次，熔断 {circuit['cooldown']:.0f} 秒")
+            self.changed.add(host)
+
+    def save(self):
+        """将本次变化的主机状态合并写回"""
+        if not self.changed:
+            return
+        with store.file_lock(self.path):
+            circuits = store.load_json(self.path)
+            for host in self.changed:
+                circuits[host] = self.circuits[host]
+            store.save_json(self.path, circuits)
+        self.changed.clear()
+
+
+breaker = CircuitBreaker()
+
+
+def is_failure(status):
+    """status 为 None 表示连接失败/超时；5xx 视为主机故障"""
+    return status is None or status >= 500
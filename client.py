@@ -0,0 +1,323 @@
+"""
+公共HTTP客户端
+所有脚本通过 new_session() 创建会话：
+- 进程内所有会话共用同一个连接适配器，按主机维护连接池并复用长连接
+- 新建TLS连接时复用同一主机上次的TLS会话（会话恢复），减少完整握手
+- 统一默认超时与请求头（User-Agent 集中定义于此）
+- 适配器继承自限速适配器，所有请求都经过按主机限速，并在此统一计数
+- 每个请求先经过按主机的熔断器，超时时间不超过整次运行剩余时间（SIGN_RUN_DEADLINE）；
+  new_session(deadline=False) 的会话（企业微信通知）不受截止时间限制，只按各请求自身的超时
+- get() 为幂等请求提供抖动退避重试；签到等有副作用的请求直接用 session 发送，不做重试
+- get(..., hedge=True) 为关键路径上的查询开启对冲请求（见 hedge.py）
+- 按 URL 策略使用磁盘缓存与条件请求（见 httpcache.py）
+- scan() 流式读取响应，找到所需内容或读满字节上限即关闭连接，不再下载与解码剩余部分
+HTTP_ENGINE=asyncio 时改用 aioengine 的 HTTP/2 传输层（需安装 httpx[http2]）：emqd、ikuuu 的账号流程
+在同一事件循环上以协程并发，其余脚本经 SyncSession 使用，各账号仍各占一个工作线程
+"""
+import os
+import ssl
+import sys
+import time
+import atexit
+import random
+import codecs
+import functools
+import logging
+import threading
+from collections import Counter
+from urllib.parse import urlparse
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from urllib3.util.ssl_ import create_urllib3_context
+
+import ratelimit
+import httpcache
+from hedge import fetch as hedge_fetch
+import breaker
+
+logger = logging.getLogger(__name__)
+
+# 统一的 User-Agent
+DESKTOP_UA = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36"
+EDGE_UA = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36 Edg/122.0.0.0"
+FIREFOX_UA = "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:74.0) Gecko/20100101 Firefox/76.0"
+ECLOUD_UA = "Mozilla/5.0 (Linux; Android 5.1.1; SM-G930K Build/NRD90M; wv) AppleWebKit/537.36 (KHTML, like Gecko) Version/4.0 Chrome/74.0.3729.136 Mobile Safari/537.36 Ecloud/8.6.3 Android/22 clientId/355325117317828 clientModel/SM-G930K imsi/460071114317824 clientChannelId/qq proVersion/1.0.6"
+
+# 默认超时（连接, 读取）
+DEFAULT_TIMEOUT = (5, 20)
+# 连接池：最多缓存的主机数、每个主机保持的连接数
+POOL_HOSTS = 32
+POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', '16'))
+# 请求引擎：requests（默认）或 asyncio
+ENGINE = os.environ.get('HTTP_ENGINE', 'requests')
+
+# 各阶段超时（连接, 读取）
+PHASE_TIMEOUTS = {
+    'login': (5, 15),
+    'sign': (5, 15),
+    'info': (5, 10),
+}
+# 整次运行的截止时间（秒），超过后不再发出新请求
+RUN_DEADLINE = float(os.environ.get('SIGN_RUN_DEADLINE', '900'))
+_run_started = time.monotonic()
+
+# 幂等 GET 的重试次数、退避基数（秒）及可重试的状态码
+GET_RETRIES = 2
+BACKOFF_BASE = 0.5
+RETRY_STATUS = (500, 502, 503, 504)
+
+# 流式读取的块大小、默认字节上限
+SCAN_CHUNK = 8192
+SCAN_LIMIT = 256 * 1024
+
+# 请求与TLS握手计数，便于统计连接复用情况
+stats = Counter()
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """已超过整次运行的截止时间，请求未发出"""
+
+
+def remaining():
+    """整次运行剩余的秒数"""
+    return RUN_DEADLINE - (time.monotonic() - _run_started)
+
+
+def timeout(phase):
+    """返回指定阶段的超时设置"""
+    return PHASE_TIMEOUTS.get(phase, DEFAULT_TIMEOUT)
+
+
+def clamp_timeout(value):
+    """按整次运行剩余时间收紧超时；已超过截止时间则抛出 DeadlineExceeded"""
+    left = remaining()
+    if left <= 0:
+        raise DeadlineExceeded(f"已超过整次运行截止时间（{RUN_DEADLINE:.0f} 秒）")
+    value = value or DEFAULT_TIMEOUT
+    if isinstance(value, tuple):
+        return tuple(min(v, left) for v in value)
+    return min(value, left)
+
+
+class ResumableSSLSocket(ssl.SSLSocket):
+    """关闭连接前记下TLS会话（TLS 1.3 的会话票据在握手之后才下发）"""
+
+    def close(self):
+        if self.server_hostname and isinstance(self.context, ResumingSSLContext):
+            self.context.remember(self.server_hostname, self)
+        super().close()
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """按主机缓存TLS会话，新连接握手时尝试恢复"""
+    sslsocket_class = ResumableSSLSocket
+
+    def __new__(cls, *args, **kwargs):
+        context = super().__new__(cls, ssl.PROTOCOL_TLS_CLIENT)
+        context._sessions = {}
+        context._sessions_lock = threading.Lock()
+        return context
+
+    def remember(self, hostname, sslsock):
+        try:
+            session = sslsock.session
+        except (ValueError, OSError):
+            return
+        if session is not None:
+            with self._sessions_lock:
+                self._sessions[hostname] = session
+
+    def wrap_socket(self, sock, *args, server_hostname=None, session=None, **kwargs):
+        with self._sessions_lock:
+            session = session or self._sessions.get(server_hostname)
+        sslsock = super().wrap_socket(sock, *args, server_hostname=server_hostname, session=session, **kwargs)
+        stats['tls_resumed' if sslsock.session_reused else 'tls_handshakes'] += 1
+        self.remember(server_hostname, sslsock)
+        return sslsock
+
+
+def _ssl_context():
+    # 与 urllib3 默认配置一致（协议版本、加密套件、证书校验），仅替换为可恢复会话的上下文
+    context = create_urllib3_context()
+    resuming = ResumingSSLContext()
+    resuming.minimum_version = context.minimum_version
+    resuming.options = context.options
+    resuming.verify_mode = context.verify_mode
+    resuming.check_hostname = context.check_hostname
+    resuming.load_default_certs()
+    return resuming
+
+
+class PooledAdapter(ratelimit.RateLimitAdapter):
+    """进程内共享的连接适配器：连接池、TLS会话恢复、默认超时、限速"""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, deadline=True):
+        self.timeout = timeout
+        self.deadline = deadline
+        self.ssl_context = _ssl_context()
+        super().__init__(pool_connections=POOL_HOSTS, pool_maxsize=POOL_MAXSIZE)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs.setdefault('ssl_context', self.ssl_context)
+        super().init_poolmanager(*args, **kwargs)
+
+    def send(self, request, timeout=None, stream=False, **kwargs):
+        entry = None if stream else httpcache.cache.lookup(request.method, request.url)
+        if entry:
+            if httpcache.cache.fresh(entry):
+                return self._cached_response(request, entry['status'], entry['headers'], httpcache.cache.hit(entry))
+            request.headers.update(httpcache.cache.validators(entry))
+
+        response = self._send(request, timeout=timeout, stream=stream, **kwargs)
+        if entry and response.status_code == 304:
+            status, headers, body = httpcache.cache.revalidated(entry, response.headers)
+            response.status_code = status
+            response.headers = CaseInsensitiveDict(headers)
+            response.encoding = get_encoding_from_headers(response.headers)
+            response._content = body
+        elif not stream:
+            httpcache.cache.store(request.method, request.url, response.status_code, response.headers, response.content)
+        return response
+
+    @staticmethod
+    def _cached_response(request, status, headers, body):
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = body
+        response.url = request.url
+        response.request = request
+        response.reason = 'OK'
+        return response
+
+    def _send(self, request, timeout=None, **kwargs):
+        host = urlparse(request.url).hostname
+        timeout = clamp_timeout(timeout or self.timeout) if self.deadline else timeout or self.timeout
+        breaker.breaker.check(host)
+        stats[host] += 1
+        try:
+            response = super().send(request, timeout=timeout, **kwargs)
+        except Exception:
+            breaker.breaker.record(host, False)
+            raise
+        breaker.breaker.record(host, not breaker.is_failure(response.status_code))
+        return response
+
+    def close(self):
+        # 适配器由所有会话共用，单个会话关闭时不释放连接池
+        pass
+
+
+adapter = PooledAdapter()
+# 不受整次运行截止时间限制的适配器（退出阶段仍需完成的通知）
+unbounded_adapter = PooledAdapter(deadline=False)
+
+
+def new_session(user_agent=DESKTOP_UA, headers=None, deadline=True):
+    """创建挂载共享连接池的会话；cookies 与请求头按会话隔离
+
+    deadline=False 时不受整次运行截止时间限制（始终使用同步客户端）
+    """
+    if ENGINE == 'asyncio' and deadline:
+        import aioengine
+        return aioengine.engine().sync_session(user_agent, headers)
+
+    session = requests.Session()
+    mounted = adapter if deadline else unbounded_adapter
+    session.mount('http://', mounted)
+    session.mount('https://', mounted)
+    session.headers['User-Agent'] = user_agent
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+def _is_transient(error):
+    """连接失败、超时等可重试的网络错误（熔断与超过截止时间除外）"""
+    if isinstance(error, (DeadlineExceeded, breaker.CircuitOpenError)):
+        return False
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    httpx = sys.modules.get('httpx')
+    return bool(httpx) and isinstance(error, httpx.TransportError)
+
+
+def get(session, url, phase='info', retries=GET_RETRIES, hedge=False, **kwargs):
+    """幂等 GET：网络错误或 5xx 时按抖动指数退避重试（签到等有副作用的请求不要使用）
+    hedge=True 时超过该接口 p95 未返回会发出对冲请求，仅用于关键路径上的查询"""
+    kwargs.setdefault('timeout', timeout(phase))
+    send = functools.partial(hedge_fetch, session) if hedge else session.get
+    for attempt in range(retries + 1):
+        last = attempt == retries
+        try:
+            response = send(url, **kwargs)
+            if last or response.status_code not in RETRY_STATUS:
+                return response
+            if kwargs.get('stream'):
+                # 流式响应未读取，重试前释放连接
+                response.close()
+        except Exception as e:
+            if last or not _is_transient(e):
+                raise
+        delay = BACKOFF_BASE * 2 ** attempt * random.uniform(0.5, 1.5)
+        if delay >= remaining():
+            raise DeadlineExceeded(f"剩余运行时间不足，放弃重试 {url}")
+        time.sleep(delay)
+
+
+def scan(session, url, find, method='GET', phase='info', max_bytes=SCAN_LIMIT, retries=GET_RETRIES, **kwargs):
+    """流式读取响应，返回 (响应, 结果)
+    每读到一块就以已读文本调用 find，返回值不为 None 时立即关闭连接；
+    读满 max_bytes 或读完仍未找到时结果为 None。response.content 为已读取的部分
+    GET 按 get() 重试（有副作用的 GET 需传 retries=0）；
+    匹配磁盘缓存策略的 URL（只有静态资源，登录页等令牌页面不缓存）读取完整响应以便写入缓存，
+    异步引擎的会话不支持流式读取，这两种情况读取完整响应后再查找"""
+    kwargs.setdefault('timeout', timeout(phase))
+    cacheable = method == 'GET' and httpcache.cache.enabled and httpcache.cache.policy(url)
+    if not isinstance(session, requests.Session) or cacheable:
+        response = _request(session, method, url, phase, retries, **kwargs)
+        return response, find(response.text)
+
+    response = _request(session, method, url, phase, retries, stream=True, **kwargs)
+    decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+    chunks, text, result, read = [], '', None, 0
+    try:
+        for chunk in response.iter_content(SCAN_CHUNK):
+            chunks.append(chunk)
+            read += len(chunk)
+            text += decoder.decode(chunk)
+            result = find(text)
+            if result is not None or read >= max_bytes:
+                break
+        else:
+            text += decoder.decode(b'', final=True)
+            result = find(text)
+        # 响应体未读完（已知长度时）即提前关闭，计入统计
+        if getattr(response.raw, 'length_remaining', None):
+            stats['scan_closed_early'] += 1
+    finally:
+        # 未读完时关闭会丢弃该连接，读完时连接归还连接池
+        response.close()
+    response._content = b''.join(chunks)
+    response._content_consumed = True
+    return response, result
+
+
+def _request(session, method, url, phase, retries, **kwargs):
+    if method == 'GET':
+        return get(session, url, phase=phase, retries=retries, **kwargs)
+    return session.request(method, url, **kwargs)
+
+
+def markers(*texts):
+    """scan() 的查找函数：返回文本中已出现的标记（按参数顺序取第一个）"""
+    return lambda text: next((marker for marker in texts if marker in text), None)
+
+
+@atexit.register
+def _log_stats():
+    if stats:
+        logger.debug(f"HTTP连接统计: {dict(stats)}")
@@ -3,11 +3,23 @@ cron: 0 7-19/6 * * *
 name: MEFRP签到
 """
 import os
-import requests
+import json
+import base64
 import logging
 import time
+import threading
 from urllib.parse import urljoin
 
+import wecom
+import snapshots
+import runner
+import client
+import ledger
+import vault
+
+if client.ENGINE == 'asyncio':
+    import aioengine
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -15,13 +27,24 @@ logging.basicConfig(
     handlers=[logging.StreamHandler()]
 )
 
+# 令牌到期前多少秒视为过期，提前重新登录
+TOKEN_EXPIRY_MARGIN = 300
+
+
+def token_expiry(token):
+    """从 JWT 载荷中解析过期时间，无法解析时返回 None"""
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload)).get('exp')
+    except (IndexError, ValueError, AttributeError):
+        return None
+
 class MefrpMultiSign:
     def __init__(self):
-        self.session = requests.Session()
         self.base_url = "https://www.mefrp.com"
         self.api_url = "https://api.mefrp.com"
         self.headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36",
             "Referer": f"{self.base_url}/"
         }
 
@@ -40,60 +63,77 @@ class MefrpMultiSign:
         if not all([self.corpid, self.secret, self.agentid]):
             raise ValueError("未配置企业微信环境变量")
 
-    def _get_access_token(self):
-        """获取企业微信access_token"""
-        url = f"https://qyapi.weixin.qq.com/cgi-bin/gettoken?corpid={self.corpid}&corpsecret={self.secret}"
-        try:
-            response = requests.get(url, timeout=10)
-            if response.json().get('errcode') == 0:
-                return response.json()['access_token']
-            logging.error(f"获取token失败: {response.text}")
-        except Exception as e:
-            logging.error(f"获取token异常: {str(e)}")
-        return None
+        self.ledger = ledger.SignLedger('emqd')
+        # 各账号的登录令牌（加密保存），本次运行中的变化在结束时写回
+        self.tokens = vault.load('mefrp_tokens')
+        self.token_changes = {}
+        self.token_lock = threading.Lock()
+
+    def _new_session(self):
+        """每个账号使用独立会话，登录态互不干扰"""
+        return client.new_session(headers=self.headers)
 
-    def login(self, username, password):
+    def login(self, session, username, password):
         """执行登录操作"""
         login_url = urljoin(self.api_url, "/api/public/login")
         data = {"username": username, "password": password}
         
         try:
-            response = self.session.post(login_url, json=data, headers=self.headers)
-            if response.json().get("code") == 200:
-                token = response.json()["data"]["token"]
-                self.headers.update({"Authorization": f"Bearer {token}"})
-                logging.info(f"账号 {username} 登录成功")
-                return True
-            logging.error(f"账号 {username} 登录失败: {response.text}")
+            response = session.post(login_url, json=data, timeout=client.timeout('login'))
+            return self._logged_in(session, username, response)
+        except Exception as e:
+            logging.error(f"账号 {username} 登录请求异常: {str(e)}")
+        return False
+
+    async def login_async(self, session, username, password):
+        """login() 的协程版本"""
+        login_url = urljoin(self.api_url, "/api/public/login")
+        data = {"username": username, "password": password}
+        try:
+            response = await session.post(login_url, json=data, timeout=client.timeout('login'))
+            return self._logged_in(session, username, response)
         except Exception as e:
             logging.error(f"账号 {username} 登录请求异常: {str(e)}")
         return False
 
-    def sign_in(self):
+    def _logged_in(self, session, username, response):
+        """处理登录响应，成功时保存令牌并设置到会话"""
+        if response.json().get("code") == 200:
+            token = response.json()["data"]["token"]
+            session.headers.update({"Authorization": f"Bearer {token}"})
+            self._set_token(username, {"token": token, "expires": token_expiry(token)})
+            logging.info(f"账号 {username} 登录成功")
+            return True
+        logging.error(f"账号 {username} 登录失败: {response.text}")
+        return False
+
+    def _set_token(self, username, entry):
+        with self.token_lock:
+            self.token_changes[username] = entry
+            if entry is None:
+                self.tokens.pop(username, None)
+            else:
+                self.tokens[username] = entry
+
+    def use_cached_token(self, session, username):
+        """使用未过期的缓存令牌，成功返回 True"""
+        entry = self.tokens.get(username)
+        if not entry:
+            return False
+        if entry.get("expires") and entry["expires"] - TOKEN_EXPIRY_MARGIN < time.time():
+            self._set_token(username, None)
+            return False
+        session.headers.update({"Authorization": f"Bearer {entry['token']}"})
+        logging.info(f"账号 {username} 使用缓存令牌")
+        return True
+
+    def sign_in(self, session):
         """执行签到操作"""
         sign_url = urljoin(self.api_url, "/api/auth/user/sign")
         try:
-            response = self.session.get(sign_url, headers=self.headers)
-            res = response.json()
-            
-            if res.get("code") == 200:
-                return {
-                    "success": True,
-                    "traffic": res["data"]["extraTraffic"],
-                    "message": "签到成功"
-                }
-            elif res.get("code") == 403 and "已签到" in res.get("message", ""):
-                return {
-                    "success": True,
-                    "traffic": 0,
-                    "message": res["message"]
-                }
-            else:
-                logging.error(f"签到失败: {response.text}")
-                return {
-                    "success": False,
-                    "message": res.get("message", "未知错误")
-                }
+            # 签到接口有副作用，不做重试
+            response = session.get(sign_url, timeout=client.timeout('sign'))
+            return self._sign_result(response)
         except Exception as e:
             logging.error(f"签到请求异常: {str(e)}")
             return {
@@ -101,114 +141,226 @@ class MefrpMultiSign:
                 "message": str(e)
             }
 
-    def get_user_info(self):
+    async def sign_in_async(self, session):
+        """sign_in() 的协程版本"""
+        sign_url = urljoin(self.api_url, "/api/auth/user/sign")
+        try:
+            response = await session.get(sign_url, timeout=client.timeout('sign'))
+            return self._sign_result(response)
+        except Exception as e:
+            logging.error(f"签到请求异常: {str(e)}")
+            return {
+                "success": False,
+                "message": str(e)
+            }
+
+    def _sign_result(self, response):
+        """解析签到接口响应"""
+        res = response.json() if response.status_code != 401 else {"code": 401}
+        if res.get("code") == 401:
+            return {"success": False, "unauthorized": True, "message": "令牌失效"}
+        
+        if res.get("code") == 200:
+            return {
+                "success": True,
+                "traffic": res["data"]["extraTraffic"],
+                "message": "签到成功"
+            }
+        elif res.get("code") == 403 and "已签到" in res.get("message", ""):
+            return {
+                "success": True,
+                "traffic": 0,
+                "message": res["message"]
+            }
+        else:
+            logging.error(f"签到失败: {response.text}")
+            return {
+                "success": False,
+                "message": res.get("message", "未知错误")
+            }
+
+    def get_user_info(self, session):
         """通过API获取用户信息"""
         info_url = urljoin(self.api_url, "/api/auth/user/info")
         try:
-            response = self.session.get(info_url, headers=self.headers)
-            res = response.json()
-            
-            if res.get("code") == 200:
-                data = res["data"]
-                username = data.get("username", "未知用户")
-                # 将MB转换为GB并保留2位小数
-                traffic_mb = data.get('traffic', 0)
-                traffic_gb = round(traffic_mb / 1024, 2)
-                traffic = f"{traffic_gb} GB"
-                return username, traffic
-            else:
-                logging.error(f"获取用户信息失败: {response.text}")
-                return None, None
+            response = client.get(session, info_url, hedge=True)
+            return self._user_info(response)
         except Exception as e:
             logging.error(f"获取用户信息异常: {str(e)}")
             return None, None
 
-    def wx_push(self, results):
-        """企业微信应用消息推送（合并所有账号结果）"""
-        access_token = self._get_access_token()
-        if not access_token:
-            return
+    async def get_user_info_async(self, session):
+        """get_user_info() 的协程版本"""
+        info_url = urljoin(self.api_url, "/api/auth/user/info")
+        try:
+            response = await aioengine.get(session, info_url, hedge=True)
+            return self._user_info(response)
+        except Exception as e:
+            logging.error(f"获取用户信息异常: {str(e)}")
+            return None, None
 
-        url = f"https://qyapi.weixin.qq.com/cgi-bin/message/send?access_token={access_token}"
+    def _user_info(self, response):
+        """解析用户信息接口响应，返回 (用户名, 剩余流量)"""
+        res = response.json()
         
-        # 构建合并消息内容
-        content = "【MEFRP多账号签到通知】\n\n"
+        if res.get("code") == 200:
+            data = res["data"]
+            username = data.get("username", "未知用户")
+            # 将MB转换为GB并保留2位小数
+            traffic_mb = data.get('traffic', 0)
+            traffic_gb = round(traffic_mb / 1024, 2)
+            traffic = f"{traffic_gb} GB"
+            return username, traffic
+        else:
+            logging.error(f"获取用户信息失败: {response.text}")
+            return None, None
+
+    def wx_push(self, results):
+        """企业微信应用消息推送（合并所有账号结果）"""
+        # 按账号分块构建报告，超长时由推送模块分页
+        tracker = snapshots.ChangeTracker('emqd')
+        report = wecom.Report("【MEFRP多账号签到通知】\n")
         for result in results:
-            content += f"账号：{result['username']}\n"
-            content += f"签到状态：{result['sign_result']['message']}\n"
-            if result['sign_result'].get('traffic', 0) > 0:
-                content += f"本次获得：{result['sign_result']['traffic']}GB\n"
-            content += f"剩余流量：{result['traffic']}\n"
-            content += "----------------\n"
-
-        data = {
-            "touser": "@all",
-            "msgtype": "text",
-            "agentid": self.agentid,
-            "text": {"content": content},
-            "safe": 0
-        }
+            if not result['success']:
+                status, balance = snapshots.FAILED, None
+            else:
+                status = snapshots.SIGNED if result['sign_result']['message'] == "签到成功" else snapshots.ALREADY
+                balance = float(result['traffic'].split()[0])
+            changes = tracker.check(result['username'], status, balance)
+            if tracker.enabled and not changes:
+                continue
 
-        try:
-            response = requests.post(url, json=data)
-            if response.json().get('errcode') == 0:
-                logging.info("企业微信推送成功")
+            if not result['success']:
+                lines = [f"账号：{result['username']}", "签到状态：❌ 签到失败"]
             else:
-                logging.error(f"推送失败: {response.text}")
-        except Exception as e:
-            logging.error(f"推送请求异常: {str(e)}")
+                lines = [
+                    f"账号：{result['username']}",
+                    f"签到状态：{result['sign_result']['message']}",
+                ]
+                if result['sign_result'].get('traffic', 0) > 0:
+                    lines.append(f"本次获得：{result['sign_result']['traffic']}GB")
+                lines.append(f"剩余流量：{result['traffic']}")
+            if tracker.enabled:
+                lines.append(f"变化：{'、'.join(changes)}")
+            lines.append("----------------")
+            report.add("\n".join(lines), ok=result['success'])
 
-    def process_account(self, username, password):
-        """处理单个账号的签到流程"""
+        if not report.total:
+            logging.info("所有账号状态无变化，跳过推送")
+            return
+
+        if wecom.notify(report, source='emqd'):
+            tracker.save()
+            logging.info("推送消息已加入发送队列")
+        else:
+            logging.error("推送消息入队失败")
+
+    def _new_result(self, username):
+        """账号结果；今日已签到时直接使用台账缓存"""
         result = {
             "username": username,
             "success": False,
             "sign_result": None,
             "traffic": None
         }
-        
-        if not self.login(username, password):
-            return result
-            
-        sign_result = self.sign_in()
-        if not sign_result['success']:
-            return result
-            
-        username, traffic = self.get_user_info()
-        if username and traffic:
+        cached = self.ledger.cached(username)
+        if cached:
+            logging.info(f"账号 {username} 今日已签到，跳过请求")
+            result.update({
+                "success": True,
+                "sign_result": {"success": True, "traffic": 0, "message": "今日已签到（缓存）"},
+                "traffic": cached['traffic']
+            })
+        return result
+
+    def _record(self, result, sign_result, name, traffic):
+        if name and traffic:
             result.update({
                 "success": True,
                 "sign_result": sign_result,
                 "traffic": traffic
             })
+            self.ledger.record(result['username'], {"traffic": traffic})
+
+    def process_account(self, username, password):
+        """处理单个账号的签到流程"""
+        result = self._new_result(username)
+        if result['success']:
+            return result
+
+        with self._new_session() as session:
+            cached_token = self.use_cached_token(session, username)
+            if not cached_token and not self.login(session, username, password):
+                return result
+                
+            sign_result = self.sign_in(session)
+            if sign_result.get('unauthorized') and cached_token:
+                # 缓存令牌已失效，重新登录后再签到
+                logging.info(f"账号 {username} 缓存令牌失效，重新登录")
+                self._set_token(username, None)
+                if not self.login(session, username, password):
+                    return result
+                sign_result = self.sign_in(session)
+            if not sign_result['success']:
+                return result
+                
+            self._record(result, sign_result, *self.get_user_info(session))
         
         return result
 
+    async def process_account_async(self, username, password):
+        """process_account() 的协程版本，在 aioengine 的事件循环上执行"""
+        logging.info(f"正在处理账号: {username}")
+        result = self._new_result(username)
+        if result['success']:
+            return result
+
+        async with aioengine.engine().session(headers=self.headers) as session:
+            cached_token = self.use_cached_token(session, username)
+            if not cached_token and not await self.login_async(session, username, password):
+                return result
+
+            sign_result = await self.sign_in_async(session)
+            if sign_result.get('unauthorized') and cached_token:
+                logging.info(f"账号 {username} 缓存令牌失效，重新登录")
+                self._set_token(username, None)
+                if not await self.login_async(session, username, password):
+                    return result
+                sign_result = await self.sign_in_async(session)
+            if not sign_result['success']:
+                return result
+
+            self._record(result, sign_result, *await self.get_user_info_async(session))
+
+        return result
+
     def main(self):
         start_time = time.time()
         logging.info(f"开始执行多账号签到... {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(start_time))}")
         
-        results = []
-        success_count = 0
-        
-        # 遍历所有账号
+        accounts = []
         for username, password in zip(self.usernames, self.passwords):
             username = username.strip()
             password = password.strip()
-            if not username or not password:
-                continue
-                
+            if username and password:
+                accounts.append((username, password))
+
+        def worker(username, password):
             logging.info(f"正在处理账号: {username}")
-            result = self.process_account(username, password)
-            results.append(result)
-            if result['success']:
-                success_count += 1
-            # 每个账号处理完后稍作延迟
-            time.sleep(3)
+            return self.process_account(username, password)
+
+        # 并发处理所有账号，结果保持输入顺序；asyncio 引擎下各账号为同一事件循环上的协程
+        if client.ENGINE == 'asyncio':
+            results = aioengine.run_all(self.process_account_async, accounts)
+        else:
+            results = runner.run_all(worker, accounts)
+        self.ledger.save()
+        vault.update('mefrp_tokens', self.token_changes)
+        success_count = sum(1 for r in results if r['success'])
         
         # 发送合并通知
         if results:
-            self.wx_push([r for r in results if r['success']])
+            self.wx_push(results)
         
         end_time = time.time()
         logging.info(f"执行结束，共处理 {len(results)} 个账号，成功 {success_count} 个")
@@ -0,0 +1,104 @@
+"""
+声明式字段提取
+页面需要的字段声明为 Field（名称、正则或标签文本、后处理），由 Extractor 编译后一次提取：
+- 正则字段合并为一个带分组的正则，对文本只扫描一遍（各字段的匹配不应互相重叠）
+- 标签字段等同 select_one('tag:-soup-contains("label")')，在一次遍历中逐个元素匹配；
+  lxml 可用时边解析边匹配，未用到的后半页不再解析
+所有字段都已找到时立即停止；未找到的字段不出现在结果中
+"""
+import re
+
+import htmlparse
+
+if htmlparse.BACKEND == 'lxml':
+    from lxml import etree
+
+# 增量解析时每次送入解析器的字符数
+CHUNK = 16 * 1024
+
+
+class Field:
+    """待提取的字段
+
+    pattern：正则，取第一个分组（没有分组时取整个匹配）
+    label/tag：文本包含 label 的第一个 tag 元素，取其文本
+    post：对取到的文本做后处理
+    """
+
+    def __init__(self, name, pattern=None, label=None, tag='li', post=None):
+        if (pattern is None) == (label is None):
+            raise ValueError(f"字段 {name} 需要且只能指定 pattern 或 label 之一")
+        self.name = name
+        self.pattern = pattern
+        self.label = label
+        self.tag = tag
+        self.post = post
+
+
+class Extractor:
+    """把一组字段编译为一次正则扫描与一次元素遍历"""
+
+    def __init__(self, fields, flags=0):
+        self.fields = list(fields)
+        self.element_fields = [f for f in self.fields if f.label is not None]
+        self.tags = sorted({f.tag for f in self.element_fields})
+        regex_fields = [f for f in self.fields if f.pattern is not None]
+        # 每个字段外包一层分组，匹配结束时 lastindex 即为该外层分组
+        self.groups = {}
+        parts = []
+        index = 1
+        for field in regex_fields:
+            inner = re.compile(field.pattern, flags).groups
+            self.groups[index] = (field, index + 1 if inner else index)
+            parts.append(f"({field.pattern})")
+            index += 1 + inner
+        self.regex = re.compile('|'.join(parts), flags) if parts else None
+
+    def extract(self, text, name=None):
+        """返回 {字段名: 值}；name 为页面名称（用于 HTML_CAPTURE）"""
+        htmlparse.capture(name, text)
+        found = {}
+        if self.regex:
+            self._scan(text, found)
+        if self.element_fields:
+            self._walk(text, found)
+        return found
+
+    def _store(self, found, field, value):
+        found[field.name] = field.post(value) if field.post else value
+
+    def _scan(self, text, found):
+        pending = len(self.groups)
+        for match in self.regex.finditer(text):
+            field, group = self.groups[match.lastindex]
+            if field.name in found:
+                continue
+            self._store(found, field, match.group(group))
+            pending -= 1
+            if not pending:
+                return
+
+    def _walk(self, text, found):
+        pending = [f for f in self.element_fields if f.name not in found]
+        for tag, content in self._elements(text):
+            for field in pending:
+                if field.tag == tag and field.label in content:
+                    self._store(found, field, content)
+            pending = [f for f in pending if f.name not in found]
+            if not pending:
+                return
+
+    def _elements(self, text):
+        """按元素结束顺序逐个产出 (标签名, 文本)"""
+        if htmlparse.BACKEND != 'lxml':
+            for elem in htmlparse.soup(text, only=self.tags).find_all(self.tags):
+                yield elem.name, elem.get_text()
+            return
+        parser = etree.HTMLPullParser(events=('end',), tag=self.tags)
+        for start in range(0, len(text), CHUNK):
+            parser.feed(text[start:start + CHUNK])
+            for _, elem in parser.read_events():
+                yield elem.tag, ''.join(elem.itertext())
+        parser.close()
+        for _, elem in parser.read_events():
+            yield elem.tag, ''.join(elem.itertext())
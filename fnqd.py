@@ -14,10 +14,15 @@ cron: 1 8,18 * * *
 name: 飞牛签到
 """
 import os
-import requests
-from bs4 import BeautifulSoup
+import re
 import json
 
+import wecom
+import snapshots
+import client
+import timing
+import extract
+
 def parse_cookie(cookie_str: str) -> dict:
     """解析Cookie字符串为字典"""
     return {item.split('=')[0]: item.split('=')[1] 
@@ -30,6 +35,9 @@ CORPID = os.getenv('WECOM_CORPID')
 SECRET = os.getenv('WECOM_SECRET')
 AGENTID = os.getenv('WECOM_AGENTID')
 
+# 共用会话（按主机自适应限速）
+session = client.new_session()
+
 # 解析关键Cookie参数
 cookie_dict = parse_cookie(COOKIE_STR)
 REQUIRED_COOKIES = {
@@ -37,97 +45,100 @@ REQUIRED_COOKIES = {
     'pvRK_2132_auth': cookie_dict.get('pvRK_2132_auth')
 }
 
-def get_wecom_token():
-    """获取企业微信API凭证[6,7](@ref)"""
-    try:
-        resp = requests.get(
-            f"https://qyapi.weixin.qq.com/cgi-bin/gettoken?corpid={CORPID}&corpsecret={SECRET}",
-            timeout=10
-        )
-        data = resp.json()
-        if data.get('errcode') == 0:
-            return data['access_token']
-        raise Exception(f"Token获取失败: {data.get('errmsg')}")
-    except Exception as e:
-        raise Exception(f"API请求异常: {str(e)}")
+# 单账号脚本，快照固定使用同一个键
+ACCOUNT_KEY = 'default'
+tracker = snapshots.ChangeTracker('fnqd')
 
 def push_wecom(content: str):
-    """企业微信消息推送[6,7](@ref)"""
-    try:
-        access_token = get_wecom_token()
-        url = f"https://qyapi.weixin.qq.com/cgi-bin/message/send?access_token={access_token}"
-        
-        payload = {
-            "touser": "@all",
-            "msgtype": "text",
-            "agentid": AGENTID,
-            "text": {"content": content},
-            "safe": 0
-        }
-        
-        resp = requests.post(url, json=payload)
-        result = resp.json()
-        if result.get('errcode') != 0:
-            print(f"❗ 推送失败：{result.get('errmsg')}")
-    except Exception as e:
-        print(f"🚨 推送异常：{str(e)}")
+    """企业微信消息推送（写入发件箱，后台发送）[6,7](@ref)"""
+    if not wecom.notify(content, source='fnqd'):
+        print("❗ 推送入队失败")
+
+def push_change(status: str, content: str, balance: float = None):
+    """变化推送模式下仅在状态变化时推送"""
+    changes = tracker.check(ACCOUNT_KEY, status, balance)
+    if tracker.enabled and not changes:
+        print('🔕 状态无变化，跳过推送')
+        return
+    if tracker.enabled:
+        content += f"\n🔔 变化：{'、'.join(changes)}"
+    push_wecom(content)
+    tracker.save()
+
+# 签到结果提示位于页面前部，找到即停止读取；最多读取的字节数
+SIGN_MARKERS = client.markers('恭喜您，打卡成功！', '您今天已经打过卡了')
+SIGN_SCAN_LIMIT = 64 * 1024
 
-def sign_in():
-    """执行签到核心逻辑[1,2](@ref)"""
+def sign_in(reset=None):
+    """执行签到核心逻辑[1,2](@ref)；指定 reset 时在重置时刻发出签到请求"""
     try:
         sign_url = f'https://club.fnnas.com/plugin.php?id=zqlj_sign&sign={FN_SIGN}'
-        response = requests.get(sign_url, cookies=REQUIRED_COOKIES)
+        send = lambda: client.scan(session, sign_url, SIGN_MARKERS, phase='sign', retries=0,
+                                   max_bytes=SIGN_SCAN_LIMIT, cookies=REQUIRED_COOKIES)
+        skew = None
+        if reset:
+            print('⏱️ 定时模式：等待重置时刻签到')
+            (_, marker), skew = timing.fire_at(
+                reset, session, 'https://club.fnnas.com/', send,
+                keepalive=lambda: session.request('HEAD', 'https://club.fnnas.com/', cookies=REQUIRED_COOKIES)
+            )
+        else:
+            _, marker = send()
 
-        if '恭喜您，打卡成功！' in response.text:
+        if marker == '恭喜您，打卡成功！':
             print('✅ 签到成功')
-            get_sign_info()
-        elif '您今天已经打过卡了' in response.text:
+            get_sign_info(snapshots.SIGNED, skew)
+        elif marker == '您今天已经打过卡了':
             print('⏰ 今日已签到')
-            get_sign_info()
+            get_sign_info(snapshots.ALREADY, skew)
         else:
             error_msg = '❌ 失败：Cookie可能失效'
             print(error_msg)
-            push_wecom(f"飞牛签到失败\n{error_msg}")
+            push_change(snapshots.EXPIRED, f"飞牛签到失败\n{error_msg}")
             
     except Exception as e:
         error_msg = f'🚨 请求异常：{str(e)}'
         print(error_msg)
-        push_wecom(f"飞牛签到异常\n{error_msg}")
+        push_change(snapshots.FAILED, f"飞牛签到异常\n{error_msg}")
+
+# 签到详情各项所在的 <li>（标签文本）
+SIGN_INFO_NAMES = ('最近打卡', '本月打卡', '连续打卡', '累计打卡', '累计奖励', '当前等级')
+SIGN_INFO = extract.Extractor(
+    extract.Field(name, label='当前打卡等级' if name == '当前等级' else name,
+                  post=lambda text: text.split('：')[-1].strip())
+    for name in SIGN_INFO_NAMES
+)
 
-def get_sign_info():
+def get_sign_info(status: str = snapshots.ALREADY, skew: str = None):
     """获取飞牛社区签到详情[1,5](@ref)"""
     try:
-        response = requests.get('https://club.fnnas.com/plugin.php?id=zqlj_sign', 
+        response = client.get(session, 'https://club.fnnas.com/plugin.php?id=zqlj_sign', 
                                cookies=REQUIRED_COOKIES)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        info_map = {
-            '最近打卡': 'li:-soup-contains("最近打卡")',
-            '本月打卡': 'li:-soup-contains("本月打卡")',
-            '连续打卡': 'li:-soup-contains("连续打卡")',
-            '累计打卡': 'li:-soup-contains("累计打卡")',
-            '累计奖励': 'li:-soup-contains("累计奖励")',
-            '当前等级': 'li:-soup-contains("当前打卡等级")'
-        }
+        info = SIGN_INFO.extract(response.text, name='fnqd_sign')
         
         result = []
-        for name, selector in info_map.items():
-            elem = soup.select_one(selector)
-            if elem:
-                value = elem.get_text().split('：')[-1].strip()
+        balance = None
+        for name in SIGN_INFO_NAMES:
+            if name in info:
+                value = info[name]
                 result.append(f"{name}: {value}")
+                if name == '累计奖励':
+                    match = re.search(r'\d+(?:\.\d+)?', value)
+                    balance = float(match.group()) if match else None
         
         if result:
+            if skew:
+                result.append(f"重置偏差: {skew}")
             msg = "📊 签到详情\n" + "\n".join(result)
             print(msg)
-            push_wecom(msg)
+            push_change(status, msg, balance)
         else:
             raise Exception('页面结构已变更')
             
     except Exception as e:
         error_msg = f'详情获取失败：{str(e)}'
         print(error_msg)
-        push_wecom(error_msg)
+        push_change(snapshots.FAILED, error_msg)
 
 def validate_config():
     """配置校验[5,7](@ref)"""
@@ -150,4 +161,4 @@ def validate_config():
 if __name__ == '__main__':
     validate_config()
     print('🔍 配置校验通过')
-    sign_in()
+    sign_in(timing.pending_reset())
@@ -0,0 +1,172 @@
+"""
+幂等 GET 的对冲请求
+主请求在该接口历史耗时的 p95 内未返回时，再发出一份相同的请求，取先成功返回的结果，另一份取消
+- 各接口（主机 + 路径）的耗时样本保存在状态目录，下次运行沿用学到的 p95
+- 对冲次数受预算限制：每次运行最多 HEDGE_BURST + HEDGE_RATIO × 可对冲请求数
+- 仅用于查询类请求，由调用方通过 client.get(..., hedge=True) 显式开启
+"""
+import os
+import time
+import atexit
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlparse
+
+import store
+
+logger = logging.getLogger(__name__)
+
+LATENCY_FILE = store.state_path('latency.json')
+
+# 每个接口保留的耗时样本数；样本不足时使用默认对冲延迟（秒）
+MAX_SAMPLES = 50
+MIN_SAMPLES = 10
+DEFAULT_DELAY = float(os.environ.get('HEDGE_DEFAULT_DELAY', '2'))
+MIN_DELAY = 0.2
+# 对冲预算：固定额度 + 按可对冲请求数的比例（HEDGE_RATIO=0 即关闭对冲）
+HEDGE_BURST = 2
+HEDGE_RATIO = float(os.environ.get('HEDGE_RATIO', '0.1'))
+
+# 对冲请求使用的线程池；requests 无法中断进行中的请求，落败的一份在后台线程中完成后直接关闭
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='hedge')
+
+
+def endpoint(url):
+    parsed = urlparse(url)
+    return f"{parsed.hostname}{parsed.path}"
+
+
+class LatencyTracker:
+    """按接口记录耗时样本并估算 p95"""
+
+    def __init__(self, path=LATENCY_FILE):
+        self.path = path
+        self.samples = {
+            key: deque(values, maxlen=MAX_SAMPLES)
+            for key, values in store.load_json(path).items()
+        }
+        self.changed = set()
+        self.lock = threading.Lock()
+        atexit.register(self.save)
+
+    def record(self, key, elapsed):
+        with self.lock:
+            self.samples.setdefault(key, deque(maxlen=MAX_SAMPLES)).append(round(elapsed, 3))
+            self.changed.add(key)
+
+    def p95(self, key):
+        """样本不足时返回 None"""
+        with self.lock:
+            values = sorted(self.samples.get(key, ()))
+        if len(values) < MIN_SAMPLES:
+            return None
+        return values[min(len(values) - 1, int(len(values) * 0.95))]
+
+    def save(self):
+        if not self.changed:
+            return
+        with store.file_lock(self.path):
+            saved = store.load_json(self.path)
+            with self.lock:
+                for key in self.changed:
+                    saved[key] = list(self.samples[key])
+            store.save_json(self.path, saved)
+        self.changed.clear()
+
+
+class HedgeBudget:
+    """限制对冲请求占全部可对冲请求的比例"""
+
+    def __init__(self, burst=HEDGE_BURST, ratio=HEDGE_RATIO):
+        self.burst = burst
+        self.ratio = ratio
+        self.eligible = 0
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def count(self):
+        with self.lock:
+            self.eligible += 1
+
+    def take(self):
+        """预算内返回 True 并记一次对冲"""
+        with self.lock:
+            if self.ratio <= 0 or self.used >= self.burst + self.ratio * self.eligible:
+                return False
+            self.used += 1
+            return True
+
+
+tracker = LatencyTracker()
+budget = HedgeBudget()
+stats = {'hedged': 0, 'hedge_won': 0}
+
+
+def delay(key):
+    """对冲延迟：学到的 p95，样本不足时用默认值"""
+    p95 = tracker.p95(key)
+    return DEFAULT_DELAY if p95 is None else max(MIN_DELAY, p95)
+
+
+def _timed(key, func, *args, **kwargs):
+    start = time.monotonic()
+    response = func(*args, **kwargs)
+    tracker.record(key, time.monotonic() - start)
+    return response
+
+
+def _send_now(key, func, *args, **kwargs):
+    """主请求在独立线程中立即发出（不在线程池中排队），对冲计时从实际发出时开始"""
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(_timed(key, func, *args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name='hedge-primary', daemon=True).start()
+    return future
+
+
+def _discard(future):
+    if future.exception() is None:
+        future.result().close()
+
+
+def fetch(session, url, **kwargs):
+    """发送 GET，超过 p95 未返回且预算允许时发出对冲请求，返回先成功的响应"""
+    key = endpoint(url)
+    budget.count()
+    hedge_after = delay(key)
+    if hasattr(session, 'hedged_get'):
+        # asyncio 引擎：落败的请求可直接取消
+        return session.hedged_get(url, key, hedge_after, **kwargs)
+
+    primary = _send_now(key, session.get, url, **kwargs)
+    done, _ = wait([primary], timeout=hedge_after)
+    if done or not budget.take():
+        return primary.result()
+
+    stats['hedged'] += 1
+    logger.debug(f"{key} 超过 {hedge_after:.2f}s 未返回，发出对冲请求")
+    backup = _executor.submit(_timed, key, session.get, url, **kwargs)
+    pending = {primary, backup}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is backup:
+                    stats['hedge_won'] += 1
+                for loser in pending:
+                    loser.add_done_callback(_discard)
+                return future.result()
+    return primary.result()
+
+
+@atexit.register
+def _log_stats():
+    if stats['hedged']:
+        logger.debug(f"对冲请求统计: {stats}（可对冲请求 {budget.eligible} 次）")
@@ -0,0 +1,88 @@
+"""
+页面解析公共模块
+- soup()：返回 BeautifulSoup 文档，安装了 lxml 时使用其 C 实现的解析器，否则回退到 html.parser；
+  select/find 等接口与选择器（含 :-soup-contains）不变，only 可只保留指定标签以减少建树开销
+- query()：返回 PyQuery 文档（本身基于 lxml）
+HTML_CAPTURE=on 时把解析的页面按名称保存到状态目录 pages/ 下，
+python htmlparse.py [页面文件...] 用保存的页面对比两种解析器的耗时与结果
+"""
+import os
+import sys
+import glob
+import time
+import logging
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+import store
+
+logger = logging.getLogger(__name__)
+
+try:
+    import lxml.html
+    BACKEND = 'lxml'
+except ImportError:
+    BACKEND = 'html.parser'
+
+CAPTURE = os.environ.get('HTML_CAPTURE', 'off') == 'on'
+CAPTURE_DIR = store.state_path('pages')
+
+
+def capture(name, html):
+    """HTML_CAPTURE=on 时按名称保存页面（供基准测试使用）"""
+    if not CAPTURE or not name:
+        return
+    os.makedirs(CAPTURE_DIR, exist_ok=True)
+    with open(os.path.join(CAPTURE_DIR, f'{name}.html'), 'w', encoding='utf-8') as f:
+        f.write(html)
+
+
+def soup(html, name=None, only=None, backend=None):
+    """解析为 BeautifulSoup 文档；only 为标签名（或列表）时只保留这些标签及其内容"""
+    capture(name, html)
+    return BeautifulSoup(html, backend or BACKEND, parse_only=SoupStrainer(only) if only else None)
+
+
+def query(html, name=None):
+    """解析为 PyQuery 文档"""
+    from pyquery import PyQuery
+    capture(name, html)
+    return PyQuery(html)
+
+
+def _normalize(value):
+    return ' '.join(value.split())
+
+
+def _benchmark(paths, rounds=20):
+    if not paths:
+        print(
+            f"没有可用的样本页面：以 HTML_CAPTURE=on 运行各签到脚本，页面会保存到 {CAPTURE_DIR}，\n"
+            f"或直接指定页面文件：python htmlparse.py 页面1.html [页面2.html ...]"
+        )
+        return
+    if BACKEND != 'lxml':
+        print("未安装 lxml，仅测试 html.parser")
+    backends = ['html.parser'] + (['lxml'] if BACKEND == 'lxml' else [])
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            html = f.read()
+        timings = {}
+        for backend in backends:
+            start = time.process_time()
+            for _ in range(rounds):
+                result = soup(html, backend=backend).get_text(' ')
+            timings[backend] = ((time.process_time() - start) / rounds * 1000, _normalize(result))
+        baseline_ms, baseline_text = timings['html.parser']
+        line = f"{os.path.basename(path)}（{len(html) / 1024:.0f} KB）：html.parser {baseline_ms:.1f}ms"
+        if 'lxml' in timings:
+            lxml_ms, lxml_text = timings['lxml']
+            line += (
+                f"，lxml {lxml_ms:.1f}ms（{baseline_ms / lxml_ms:.1f}x），"
+                f"文本{'一致' if lxml_text == baseline_text else '不一致'}"
+            )
+        print(line)
+
+
+if __name__ == '__main__':
+    _benchmark(sys.argv[1:] or sorted(glob.glob(os.path.join(CAPTURE_DIR, '*.html'))))
@@ -0,0 +1,223 @@
+"""
+磁盘 HTTP 缓存（按 RFC 7234 的条件请求）
+共享客户端的 GET 请求按 URL 匹配缓存策略：
+- REVALIDATE：每次都向服务器确认，带上 If-None-Match / If-Modified-Since，304 时使用缓存内容
+- FRESH：在 Cache-Control max-age（或按 Last-Modified 估算的新鲜期）内直接使用缓存，不发请求
+未匹配策略的 URL 不缓存；响应带 no-store/private 或 Vary: Cookie 时不缓存（缓存由各账号共用）
+带会话令牌的页面（Discuz formhash、天翼云盘登录页等）不缓存：304 只说明页面未变，
+令牌却属于各自的会话，复用缓存会把一个会话的令牌交给另一个会话
+缓存保存在状态目录 http_cache/ 下，HTTP_CACHE=off 可关闭；退出时报告节省的流量与往返次数
+本次运行写入过缓存时，退出前清理一次过期条目（超过 HTTP_CACHE_TTL 秒未使用，或已过新鲜期且无法重验证），
+条目数超过 HTTP_CACHE_MAX_ENTRIES 时按最近使用时间淘汰最旧的
+"""
+import os
+import re
+import time
+import atexit
+import hashlib
+import logging
+import tempfile
+import contextlib
+from collections import Counter
+from email.utils import parsedate_to_datetime
+
+from requests.structures import CaseInsensitiveDict
+
+import store
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get('HTTP_CACHE', 'on') != 'off'
+CACHE_DIR = store.state_path('http_cache')
+
+REVALIDATE = 'revalidate'
+FRESH = 'fresh'
+
+# URL 匹配规则 → 缓存策略（按顺序匹配第一条）
+POLICIES = [
+    # 静态资源
+    (re.compile(r'\.(?:css|js|png|jpe?g|gif|ico|svg|woff2?)(?:\?|$)'), FRESH),
+]
+
+UNSTORED_HEADERS = ('content-encoding', 'transfer-encoding', 'content-length', 'set-cookie')
+
+# 条目数上限、未使用多久（秒）后过期
+MAX_ENTRIES = int(os.environ.get('HTTP_CACHE_MAX_ENTRIES', '200'))
+ENTRY_TTL = float(os.environ.get('HTTP_CACHE_TTL', str(7 * 86400)))
+
+# 按 Last-Modified 估算新鲜期时的比例与上限（RFC 7234 4.2.2）
+HEURISTIC_FRACTION = 0.1
+MAX_HEURISTIC_AGE = 86400
+
+
+def _max_age(headers):
+    match = re.search(r'max-age=(\d+)', headers.get('Cache-Control', ''))
+    if match:
+        return int(match.group(1))
+    try:
+        date = parsedate_to_datetime(headers['Date']).timestamp()
+        modified = parsedate_to_datetime(headers['Last-Modified']).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return 0
+    return min(MAX_HEURISTIC_AGE, max(0, (date - modified) * HEURISTIC_FRACTION))
+
+
+def _cacheable(headers):
+    cache_control = headers.get('Cache-Control', '').lower()
+    if 'no-store' in cache_control or 'private' in cache_control:
+        return False
+    vary = headers.get('Vary', '').lower()
+    if '*' in vary or 'cookie' in vary:
+        return False
+    return bool(headers.get('ETag') or headers.get('Last-Modified') or _max_age(headers))
+
+
+class HTTPCache:
+    """按 URL 保存响应头与响应体，提供条件请求所需的校验信息"""
+
+    def __init__(self, directory=CACHE_DIR, enabled=ENABLED):
+        self.directory = directory
+        self.enabled = enabled
+        self.stats = Counter()
+        self.written = False
+        atexit.register(self.close)
+
+    def policy(self, url):
+        for pattern, policy in POLICIES:
+            if pattern.search(url):
+                return policy
+        return None
+
+    def _path(self, url):
+        return os.path.join(self.directory, hashlib.sha256(url.encode()).hexdigest())
+
+    def lookup(self, method, url):
+        """返回可用于该请求的缓存条目，没有时返回 None"""
+        if not self.enabled or method != 'GET' or not self.policy(url):
+            return None
+        entry = store.load_json(self._path(url) + '.json', default=False)
+        if not entry or entry.get('url') != url:
+            return None
+        try:
+            with open(self._path(url) + '.body', 'rb') as f:
+                entry['body'] = f.read()
+        except FileNotFoundError:
+            return None
+        entry['headers'] = CaseInsensitiveDict(entry['headers'])
+        return entry
+
+    def fresh(self, entry):
+        """FRESH 策略且仍在新鲜期内，可直接使用缓存"""
+        return self.policy(entry['url']) == FRESH and time.time() - entry['stored'] < entry['max_age']
+
+    def validators(self, entry):
+        headers = {}
+        if entry['headers'].get('ETag'):
+            headers['If-None-Match'] = entry['headers']['ETag']
+        if entry['headers'].get('Last-Modified'):
+            headers['If-Modified-Since'] = entry['headers']['Last-Modified']
+        return headers
+
+    def _touch(self, url):
+        """更新最近使用时间（元数据文件的修改时间），用于按 LRU 淘汰"""
+        with contextlib.suppress(OSError):
+            os.utime(self._path(url) + '.json')
+
+    def hit(self, entry):
+        """直接使用缓存（省去一次往返）"""
+        self._touch(entry['url'])
+        self.stats['hits'] += 1
+        self.stats['bytes_saved'] += len(entry['body'])
+        return entry['body']
+
+    def revalidated(self, entry, headers):
+        """服务器返回 304：合并新的响应头并刷新缓存时间，返回 (状态码, 响应头, 响应体)"""
+        self.stats['revalidated'] += 1
+        self.stats['bytes_saved'] += len(entry['body'])
+        merged = CaseInsensitiveDict(entry['headers'])
+        merged.update((k, v) for k, v in headers.items() if k.lower() not in UNSTORED_HEADERS)
+        self._write(entry['url'], entry['status'], merged, entry['body'])
+        return entry['status'], dict(merged), entry['body']
+
+    def store(self, method, url, status, headers, body):
+        if not self.enabled or method != 'GET' or status != 200 or not self.policy(url):
+            return
+        # requests 与 httpx 的响应头大小写不同，统一按不区分大小写处理
+        headers = CaseInsensitiveDict(headers)
+        if not _cacheable(headers):
+            return
+        self.stats['stored'] += 1
+        self._write(url, status, headers, body)
+
+    def _write(self, url, status, headers, body):
+        path = self._path(url)
+        os.makedirs(self.directory, exist_ok=True)
+        # 先写响应体再写元数据，读取方以元数据为准
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(body)
+            os.replace(tmp_path, path + '.body')
+        except Exception:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp_path)
+            raise
+        # 响应体已解压，去掉与原始传输相关的头；Set-Cookie 属于各自会话，不写入缓存
+        headers = {k: v for k, v in headers.items() if k.lower() not in UNSTORED_HEADERS}
+        store.save_json(path + '.json', {
+            'url': url,
+            'status': status,
+            'headers': headers,
+            'stored': time.time(),
+            'max_age': _max_age(CaseInsensitiveDict(headers)),
+        })
+        self.written = True
+
+    def _expired(self, meta_path, used, now):
+        if now - used > ENTRY_TTL:
+            return True
+        entry = store.load_json(meta_path, default=None)
+        if not entry:
+            return True
+        headers = CaseInsensitiveDict(entry.get('headers', {}))
+        # 已过新鲜期且没有校验信息，既不能直接使用也不能条件请求
+        revalidatable = headers.get('ETag') or headers.get('Last-Modified')
+        return not revalidatable and now - entry.get('stored', 0) >= entry.get('max_age', 0)
+
+    def prune(self):
+        """删除过期条目，并按最近使用时间淘汰超出上限的条目"""
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.startswith('.') or not name.endswith('.json'):
+                continue
+            meta_path = os.path.join(self.directory, name)
+            try:
+                used = os.path.getmtime(meta_path)
+            except OSError:
+                continue
+            entries.append((used, meta_path))
+        entries.sort(reverse=True)
+        for index, (used, meta_path) in enumerate(entries):
+            if index >= MAX_ENTRIES or self._expired(meta_path, used, now):
+                for path in (meta_path, meta_path[:-len('.json')] + '.body'):
+                    with contextlib.suppress(OSError):
+                        os.unlink(path)
+                self.stats['evicted'] += 1
+
+    def close(self):
+        """退出时清理（仅在本次运行写入过缓存时）并报告"""
+        if self.written:
+            with contextlib.suppress(OSError):
+                self.prune()
+        self.report()
+
+    def report(self):
+        if self.stats['hits'] or self.stats['revalidated']:
+            logger.info(
+                f"HTTP缓存：直接命中 {self.stats['hits']} 次（省去往返），"
+                f"304 重验证 {self.stats['revalidated']} 次，节省 {self.stats['bytes_saved'] / 1024:.1f} KB"
+            )
+
+
+cache = HTTPCache()
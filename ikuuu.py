@@ -2,15 +2,27 @@
 # -*- coding: utf-8 -*-
 
 import os
-import requests
 from datetime import datetime
-from bs4 import BeautifulSoup
+
+import wecom
+import runner
+import client
+import ledger
+import vault
+import htmlparse
+
+if client.ENGINE == 'asyncio':
+    import aioengine
 
 """
 cron: 0 7,19 * * *
 name: 爱坤VPN多账号版
 """
 
+sign_ledger = ledger.SignLedger('ikuuu')
+# 各账号登录后的 Cookie（加密保存），下次运行直接复用
+cookie_store = vault.CookieStore('ikuuu')
+
 def send_wecom_message(content):
     """发送企业微信应用消息"""
     corpid = os.environ.get('WECOM_CORPID')
@@ -21,33 +33,11 @@ def send_wecom_message(content):
         print("❌ 企业微信配置不完整")
         return False
 
-    try:
-        # 获取access_token
-        token_url = f"https://qyapi.weixin.qq.com/cgi-bin/gettoken?corpid={corpid}&corpsecret={secret}"
-        token_resp = requests.get(token_url, timeout=10).json()
-        if token_resp.get('errcode') != 0:
-            print(f"❌ 获取token失败: {token_resp.get('errmsg')}")
-            return False
-        
-        # 发送消息
-        send_url = f"https://qyapi.weixin.qq.com/cgi-bin/message/send?access_token={token_resp['access_token']}"
-        data = {
-            "touser": "@all",
-            "msgtype": "text",
-            "agentid": agentid,
-            "text": {"content": content},
-            "safe": 0
-        }
-        send_resp = requests.post(send_url, json=data, timeout=10).json()
-        
-        return send_resp.get('errcode') == 0
-    except Exception as e:
-        print(f"❌ 企业微信请求异常: {str(e)}")
-        return False
+    return wecom.notify(content, source='ikuuu')
 
 def parse_user_info(html):
     """解析用户页面信息"""
-    soup = BeautifulSoup(html, 'html.parser')
+    soup = htmlparse.soup(html, name='ikuuu_user')
     info = {'membership': '未知', 'traffic': '未知'}
     
     try:
@@ -63,11 +53,36 @@ def parse_user_info(html):
     
     return info
 
-def process_account(host, username, password):
-    """处理单个账号签到"""
-    session = requests.Session()
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/89.0.4389.82 Safari/537.36'}
-    result = {
+def login(session, host, username, password):
+    login_resp = session.post(f"{host}/auth/login", data={"email": username, "passwd": password}, timeout=client.timeout('login'))
+    _check_login(login_resp)
+
+async def login_async(session, host, username, password):
+    """login() 的协程版本"""
+    login_resp = await session.post(f"{host}/auth/login", data={"email": username, "passwd": password}, timeout=client.timeout('login'))
+    _check_login(login_resp)
+
+def _check_login(login_resp):
+    if login_resp.status_code != 200 or login_resp.json().get('ret') != 1:
+        raise Exception(f"登录失败：{login_resp.json().get('msg', '未知错误')}")
+
+def checkin(session, host):
+    """签到，返回接口 JSON；未登录（被重定向到登录页、返回非 JSON）时返回 None"""
+    return _checkin_data(session.post(f"{host}/user/checkin", timeout=client.timeout('sign')))
+
+async def checkin_async(session, host):
+    """checkin() 的协程版本"""
+    return _checkin_data(await session.post(f"{host}/user/checkin", timeout=client.timeout('sign')))
+
+def _checkin_data(resp):
+    try:
+        data = resp.json()
+    except ValueError:
+        return None
+    return data if 'ret' in data else None
+
+def _new_result(username):
+    return {
         'username': username,
         'status': '❌ 未执行',
         'traffic_gain': '0B',
@@ -76,40 +91,97 @@ def process_account(host, username, password):
         'traffic_used': '未知'
     }
 
+def _cached_result(result):
+    """今日已签到时直接使用台账缓存，返回是否命中"""
+    cached = sign_ledger.cached(result['username'])
+    if cached:
+        print(f"ℹ️ {result['username']} 今日已签到，跳过请求")
+        result.update(cached, status="ℹ️ 今日已签到（缓存）")
+    return bool(cached)
+
+def _fill_result(result, checkin_data, user_html):
+    """按签到接口返回与用户页面填写结果，并记入台账"""
+    user_info = parse_user_info(user_html)
+
+    # 处理结果
+    if checkin_data.get('ret') == 1:
+        result['status'] = "✅ 签到成功"
+        result['traffic_gain'] = checkin_data.get('msg', '0B')
+    elif "已经签到" in checkin_data.get('msg', ''):
+        result['status'] = "ℹ️ 今日已签到"
+    else:
+        result['status'] = f"❌ 签到失败：{checkin_data.get('msg', '未知错误')}"
+
+    result.update({
+        'membership': user_info['membership'],
+        'traffic': user_info['traffic'],
+        'traffic_used': checkin_data.get('trafficInfo', '未知')
+    })
+    if not result['status'].startswith("❌"):
+        sign_ledger.record(result['username'], {
+            key: result[key] for key in ('membership', 'traffic', 'traffic_used')
+        })
+
+def process_account(host, username, password):
+    """处理单个账号签到"""
+    session = client.new_session()
+    result = _new_result(username)
+    if _cached_result(result):
+        return result
+
     try:
-        # 登录
-        login_resp = session.post(f"{host}/auth/login", headers=headers, data={"email": username, "passwd": password})
-        if login_resp.status_code != 200 or login_resp.json().get('ret') != 1:
-            raise Exception(f"登录失败：{login_resp.json().get('msg', '未知错误')}")
-
-        # 签到
-        checkin_resp = session.post(f"{host}/user/checkin", headers=headers)
-        checkin_data = checkin_resp.json()
+        # 先用保存的登录态直接签到（签到接口同时用于校验登录态），失效时再登录
+        checkin_data = None
+        if cookie_store.restore(username, session):
+            checkin_data = checkin(session, host)
+            if checkin_data is None:
+                print(f"ℹ️ {username} 保存的登录态已失效，重新登录")
+                cookie_store.discard(username, session)
+        if checkin_data is None:
+            login(session, host, username, password)
+            checkin_data = checkin(session, host)
+            if checkin_data is None:
+                raise Exception("签到接口返回异常")
+        cookie_store.save(username, session)
         
         # 获取用户信息
-        user_resp = session.get(f"{host}/user")
-        user_info = parse_user_info(user_resp.text)
-
-        # 处理结果
-        if checkin_data.get('ret') == 1:
-            result['status'] = "✅ 签到成功"
-            result['traffic_gain'] = checkin_data.get('msg', '0B')
-        elif "已经签到" in checkin_data.get('msg', ''):
-            result['status'] = "ℹ️ 今日已签到"
-        else:
-            result['status'] = f"❌ 签到失败：{checkin_data.get('msg', '未知错误')}"
-
-        result.update({
-            'membership': user_info['membership'],
-            'traffic': user_info['traffic'],
-            'traffic_used': checkin_data.get('trafficInfo', '未知')
-        })
+        user_resp = client.get(session, f"{host}/user", hedge=True)
+        _fill_result(result, checkin_data, user_resp.text)
 
     except Exception as e:
         result['status'] = f"❌ 处理异常：{str(e)}"
     
     return result
 
+async def process_account_async(host, username, password):
+    """process_account() 的协程版本，在 aioengine 的事件循环上执行"""
+    result = _new_result(username)
+    if _cached_result(result):
+        return result
+
+    async with aioengine.engine().session() as session:
+        try:
+            checkin_data = None
+            if cookie_store.restore(username, session):
+                checkin_data = await checkin_async(session, host)
+                if checkin_data is None:
+                    print(f"ℹ️ {username} 保存的登录态已失效，重新登录")
+                    cookie_store.discard(username, session)
+            if checkin_data is None:
+                await login_async(session, host, username, password)
+                checkin_data = await checkin_async(session, host)
+                if checkin_data is None:
+                    raise Exception("签到接口返回异常")
+            cookie_store.save(username, session)
+
+            user_resp = await aioengine.get(session, f"{host}/user", hedge=True)
+            _fill_result(result, checkin_data, user_resp.text)
+
+        except Exception as e:
+            result['status'] = f"❌ 处理异常：{str(e)}"
+
+    return result
+
 def main():
     # 基础配置
     host = os.environ.get('HOST', '').rstrip('/')
@@ -132,30 +204,43 @@ def main():
 
     # 处理所有账号
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    report = [f"⏰ 当前时间：{timestamp}\n🌐 站点：{host}\n"]
+    report = wecom.Report("[ikuuu多账号签到报告]")
+    report.add_header(f"⏰ 当前时间：{timestamp}\n🌐 站点：{host}")
     
-    for i, (username, password) in enumerate(zip(usernames, passwords)):
+    def worker(i, username, password):
         print(f"\n处理账号 {i+1}/{len(usernames)}：{username}")
-        account_result = process_account(host, username.strip(), password.strip())
-        
+        return process_account(host, username.strip(), password.strip())
+
+    async def worker_async(i, username, password):
+        print(f"\n处理账号 {i+1}/{len(usernames)}：{username}")
+        return await process_account_async(host, username.strip(), password.strip())
+
+    # 并发处理所有账号，结果保持输入顺序；asyncio 引擎下各账号为同一事件循环上的协程
+    accounts = [(i, u, p) for i, (u, p) in enumerate(zip(usernames, passwords))]
+    if client.ENGINE == 'asyncio':
+        results = aioengine.run_all(worker_async, accounts)
+    else:
+        results = runner.run_all(worker, accounts)
+    for account_result in results:
         # 构建单账号报告
-        report.append(
+        report.add(
             f"\n🔹 账号：{account_result['username']}\n"
             f"  状态：{account_result['status']}\n"
             f"  获得流量：{account_result['traffic_gain']}\n"
             f"  会员时长：{account_result['membership']}\n"
             f"  剩余流量：{account_result['traffic']}\n"
-            f"  今日已用：{account_result['traffic_used']}"
+            f"  今日已用：{account_result['traffic_used']}",
+            ok=not account_result['status'].startswith("❌")
         )
+    sign_ledger.save()
 
     # 合并推送消息
-    full_message = f"[ikuuu多账号签到报告]\n{''.join(report)}"
-    print("\n最终推送消息：\n" + full_message)
+    print(f"\n最终推送消息：\n{report}")
     
-    if send_wecom_message(full_message):
-        print("✅ 推送成功")
+    if send_wecom_message(report):
+        print("✅ 已加入推送队列")
     else:
-        print("❌ 推送失败")
+        print("❌ 推送入队失败")
 
 if __name__ == "__main__":
     main()
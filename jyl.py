@@ -3,8 +3,15 @@ import logging
 import requests
 import re
 import json
-from pyquery import PyQuery as pq
-from datetime import datetime
+from datetime import datetime, timedelta
+
+import wecom
+import client
+import ledger
+import store
+import vault
+import htmlparse
+import extract
 """
 cron: 0 7,19 * * *
 name: 皎月连
@@ -16,6 +23,37 @@ logging.basicConfig(
     handlers=[logging.StreamHandler()]
 )
 
+# 保存下次可签到时间与服务到期时间，未到签到时间时不登录
+SCHEDULE_FILE = store.state_path('jyl_schedule.json')
+# 服务到期前多少天推送提醒（0 为不提醒）
+EXPIRE_REMIND_DAYS = float(os.environ.get('JYL_EXPIRE_REMIND_DAYS', '0'))
+TIME_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d', '%Y/%m/%d %H:%M:%S', '%Y/%m/%d')
+
+# 登录后的 Cookie（加密保存），下次运行验证有效即跳过登录
+cookie_store = vault.CookieStore('jyl')
+
+SIGN_PAGE = "https://www.natpierce.cn/pc/sign/index.html"
+
+class PageCache:
+    """本次运行内的页面缓存：同时保存响应文本与解析后的文档，签到等改变状态的请求后失效"""
+
+    def __init__(self):
+        self.pages = {}
+
+    def put(self, url, response):
+        response.raise_for_status()
+        self.pages[url] = (response.text, htmlparse.query(response.text, name='jyl_sign'))
+        return self.pages[url]
+
+    def get(self, session, url, **kwargs):
+        """返回 (页面文本, PyQuery 文档)，未缓存时请求并解析"""
+        if url not in self.pages:
+            self.put(url, client.get(session, url, **kwargs))
+        return self.pages[url]
+
+    def invalidate(self):
+        self.pages.clear()
+
 def send_wecom_message(content, user_info=None):
     """发送企业微信应用消息"""
     try:
@@ -27,13 +65,6 @@ def send_wecom_message(content, user_info=None):
             logging.error("企业微信环境变量缺失")
             return False
 
-        # 获取access_token
-        token_url = f"https://qyapi.weixin.qq.com/cgi-bin/gettoken?corpid={corpid}&corpsecret={secret}"
-        token_res = requests.get(token_url, timeout=10).json()
-        if token_res.get('errcode') != 0:
-            logging.error(f"Token获取失败: {token_res}")
-            return False
-
         # 构建消息内容
         message = f"⏰ 皎月连签到通知\n🕒 时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n📢 状态：{content}"
         
@@ -45,33 +76,19 @@ def send_wecom_message(content, user_info=None):
                 f"└ 下次签到：{user_info.get('next_sign', 'N/A')}"
             ])
 
-        # 构建消息体
-        msg_url = f"https://qyapi.weixin.qq.com/cgi-bin/message/send?access_token={token_res['access_token']}"
-        payload = {
-            "touser": "@all",
-            "msgtype": "text",
-            "agentid": agentid,
-            "text": {
-                "content": message
-            }
-        }
-
-        # 发送消息
-        msg_res = requests.post(msg_url, json=payload, timeout=10).json()
-        if msg_res.get('errcode') == 0:
-            logging.debug("微信通知发送成功")
+        # 写入发件箱，由后台线程发送
+        if wecom.notify(message, source='jyl'):
+            logging.debug("微信通知已加入发送队列")
             return True
-        logging.error(f"消息发送失败: {msg_res}")
+        logging.error("消息入队失败")
         return False
     except Exception as e:
         logging.error(f"推送异常: {str(e)}")
         return False
 
-def get_login_session():
-    """创建登录会话并获取Cookie"""
-    session = requests.Session()
-    session.headers.update({
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36 Edg/122.0.0.0",
+def get_login_session(pages=None):
+    """创建登录会话并获取Cookie；验证登录态时取得的签到页存入 pages"""
+    session = client.new_session(client.EDGE_UA, {
         "Accept-Language": "zh-CN,zh;q=0.9",
         "X-Requested-With": "XMLHttpRequest"
     })
@@ -83,6 +100,18 @@ def get_login_session():
         if not all([username, password]):
             raise ValueError("未配置登录凭证环境变量 JYLZ/JYLM")
 
+        # 复用保存的登录态：签到页能看到用户信息即为有效
+        if cookie_store.restore(username, session):
+            res = client.get(session, SIGN_PAGE, phase='login')
+            if '/login/' not in str(res.url) and 'd_hao' in res.text:
+                logging.info("✅ 复用保存的登录态")
+                if pages is not None:
+                    pages.put(SIGN_PAGE, res)
+                cookie_store.save(username, session)
+                return session
+            logging.info("🔑 保存的登录态已失效，重新登录")
+            cookie_store.discard(username, session)
+
         # 构造登录请求
         login_url = "https://www.natpierce.cn/pc/login/login.html"
         login_data = {
@@ -107,7 +136,8 @@ def get_login_session():
         res = session.post(
             url=login_url,
             data=login_data,
-            headers=headers
+            headers=headers,
+            timeout=client.timeout('login')
         )
         res.raise_for_status()
         
@@ -119,7 +149,8 @@ def get_login_session():
             raise ValueError(f"登录失败：{login_result.get('message', '未知错误')}")
 
         # 访问跳转URL确认登录状态
-        session.get(login_result.get('url', 'https://www.natpierce.cn/pc/index/index.html'))
+        client.get(session, login_result.get('url', 'https://www.natpierce.cn/pc/index/index.html'), phase='login')
+        cookie_store.save(username, session)
         
         logging.info("✅ 登录成功")
         return session
@@ -129,10 +160,15 @@ def get_login_session():
         logging.error(f"🔑 登录流程异常: {str(e)}")
         raise
 
-def parse_user_info(html):
-    """解析用户信息"""
+USER_INFO = extract.Extractor([
+    extract.Field('username', r'用户名：\s*([^\n]+)', post=str.strip),
+    extract.Field('expire_time', r'服务到期时间：\s*([^\n]+)', post=str.strip),
+    extract.Field('next_sign', r'下次可签到时间：\s*([^\n]+)', post=str.strip),
+])
+
+def parse_user_info(doc):
+    """解析用户信息（doc 为签到页的 PyQuery 文档）"""
     try:
-        doc = pq(html)
         info_div = doc('.d_hao')
         if not info_div:
             return None
@@ -141,31 +177,55 @@ def parse_user_info(html):
         raw_text = raw_text.replace('&nbsp;', ' ')
         raw_text = re.sub(r'<br\s*/?>', '\n', raw_text)
         
-        info_dict = {}
-        patterns = {
-            'username': r'用户名：\s*([^\n]+)',
-            'expire_time': r'服务到期时间：\s*([^\n]+)',
-            'next_sign': r'下次可签到时间：\s*([^\n]+)'
-        }
-        
-        for key, pattern in patterns.items():
-            match = re.search(pattern, raw_text)
-            if match:
-                info_dict[key] = match.group(1).strip()
-        
+        info_dict = USER_INFO.extract(raw_text)
         return info_dict if info_dict else None
         
     except Exception as e:
         logging.error(f"📝 用户信息解析失败: {str(e)}")
         return None
 
-def check_sign_status(session):
+def parse_time(text):
+    """解析页面上的时间（北京时间），无法解析时返回 None"""
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.strptime(text.strip(), fmt).replace(tzinfo=ledger.SITE_TZ)
+        except (AttributeError, ValueError):
+            continue
+    return None
+
+def save_schedule(account, user_info):
+    """记录最新的用户信息（含下次可签到时间、服务到期时间）"""
+    if not user_info:
+        return
+    with store.file_lock(SCHEDULE_FILE):
+        schedule = store.load_json(SCHEDULE_FILE)
+        entry = schedule.setdefault(account, {})
+        entry['user_info'] = user_info
+        store.save_json(SCHEDULE_FILE, schedule)
+
+def check_expire_reminder(account, user_info):
+    """服务即将到期时推送提醒（每天最多一次）"""
+    expire = parse_time((user_info or {}).get('expire_time'))
+    now = datetime.now(ledger.SITE_TZ)
+    if not EXPIRE_REMIND_DAYS or not expire or expire - now > timedelta(days=EXPIRE_REMIND_DAYS):
+        return
+    with store.file_lock(SCHEDULE_FILE):
+        schedule = store.load_json(SCHEDULE_FILE)
+        entry = schedule.setdefault(account, {})
+        today = now.strftime('%Y-%m-%d')
+        if entry.get('reminded') == today:
+            return
+        entry['reminded'] = today
+        store.save_json(SCHEDULE_FILE, schedule)
+    left = (expire - now).total_seconds() / 86400
+    state = f"将在 {left:.1f} 天后到期" if left > 0 else "已到期"
+    wecom.notify(f"⚠️ 皎月连服务{state}\n到期时间：{user_info['expire_time']}", source='jyl')
+    logging.warning(f"⚠️ 服务{state}")
+
+def check_sign_status(session, pages):
     """检查签到状态"""
     try:
-        res = session.get("https://www.natpierce.cn/pc/sign/index.html")
-        res.raise_for_status()
-        
-        doc = pq(res.text)
+        _, doc = pages.get(session, SIGN_PAGE, hedge=True)
         sign_btn = doc('#qiandao')
         service_text = doc('.d_qd').siblings('div').text()
         
@@ -180,7 +240,7 @@ def check_sign_status(session):
     except Exception as e:
         return False, f"状态检查失败: {str(e)}"
 
-def execute_sign(session):
+def execute_sign(session, pages):
     """执行签到并返回最新信息"""
     try:
         sign_url = "https://www.natpierce.cn/pc/sign/qiandao_bf.html"
@@ -195,7 +255,9 @@ def execute_sign(session):
             "Sec-Ch-Ua-Platform": '"Windows"'
         }
         
-        res = session.post(sign_url, headers=headers)
+        res = session.post(sign_url, headers=headers, timeout=client.timeout('sign'))
+        # 签到改变了页面状态，之后重新获取
+        pages.invalidate()
         res.raise_for_status()
         
         # 解析业务响应
@@ -211,8 +273,8 @@ def execute_sign(session):
             success = False
         
         # 获取最新信息
-        res = session.get("https://www.natpierce.cn/pc/sign/index.html")
-        latest_info = parse_user_info(res.text)
+        _, doc = pages.get(session, SIGN_PAGE, hedge=True)
+        latest_info = parse_user_info(doc)
         
         return success, msg, latest_info
             
@@ -226,22 +288,45 @@ def main():
     result_msg = "未知状态"
     user_info = None
     session = None
+    sign_ledger = ledger.SignLedger('jyl')
+    account = os.environ.get('JYLZ', '')
     
     try:
+        # 未到下次可签到时间，使用上次保存的信息，不登录
+        saved_info = store.load_json(SCHEDULE_FILE).get(account, {}).get('user_info')
+        next_sign = parse_time((saved_info or {}).get('next_sign'))
+        if next_sign and datetime.now(ledger.SITE_TZ) < next_sign:
+            logging.info(f"⏳ 未到签到时间（{saved_info['next_sign']}），跳过登录")
+            result_msg, user_info = "未到签到时间", saved_info
+            return result_msg, user_info
+
+        # 今日已签到，直接使用台账缓存
+        cached = sign_ledger.cached(account)
+        if cached:
+            logging.info("📒 今日已签到，跳过请求")
+            result_msg, user_info = "今日已签到（缓存）", cached
+            return result_msg, user_info
+
         # 获取登录会话
-        session = get_login_session()
+        pages = PageCache()
+        session = get_login_session(pages)
         
         # 检查签到状态
-        can_sign, status_msg = check_sign_status(session)
+        can_sign, status_msg = check_sign_status(session, pages)
         logging.info(f"📊 当前状态: {status_msg}")
         if not can_sign:
             result_msg = status_msg
-            return result_msg, parse_user_info(session.get("https://www.natpierce.cn/pc/sign/index.html").text)
+            user_info = parse_user_info(pages.get(session, SIGN_PAGE, hedge=True)[1])
+            if user_info and not status_msg.startswith(("状态检查失败", "未找到签到按钮")):
+                sign_ledger.record(account, user_info)
+            return result_msg, user_info
 
         # 执行签到
-        sign_success, sign_msg, user_info = execute_sign(session)
+        sign_success, sign_msg, user_info = execute_sign(session, pages)
         logging.info(f"📝 签到结果: {sign_msg}")
         result_msg = sign_msg if not sign_success else "🎉 签到成功"
+        if sign_success and user_info:
+            sign_ledger.record(account, user_info)
         
         return result_msg, user_info
 
@@ -251,6 +336,10 @@ def main():
     finally:
         if session:
             session.close()
+        sign_ledger.save()
+        if session:
+            save_schedule(account, user_info)
+        check_expire_reminder(account, user_info)
         send_wecom_message(result_msg, user_info)
 
 if __name__ == "__main__":
@@ -0,0 +1,64 @@
+"""
+每日签到台账
+按站点、账号记录最近一次确认签到完成的日期（按站点重置时间划分的“签到日”），
+并缓存当时的用户信息（流量、会员时长、积分等）
+同一签到日内再次运行时，已签到且缓存未过期的账号直接使用缓存结果，不再发出任何请求
+SIGN_LEDGER=off 可临时关闭（强制完整执行）；LEDGER_INFO_TTL 为用户信息缓存有效期（秒）
+"""
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import store
+
+ENABLED = os.environ.get('SIGN_LEDGER', 'on') != 'off'
+INFO_TTL = float(os.environ.get('LEDGER_INFO_TTL', str(24 * 3600)))
+# 各站点均按北京时间重置
+SITE_TZ = timezone(timedelta(hours=8))
+
+
+class SignLedger:
+    """单个站点的签到台账"""
+
+    def __init__(self, site, reset_hour=0, info_ttl=INFO_TTL, enabled=None):
+        self.path = store.state_path(f'ledger_{site}.json')
+        self.reset_hour = reset_hour
+        self.info_ttl = info_ttl
+        self.enabled = ENABLED if enabled is None else enabled
+        self.entries = store.load_json(self.path)
+        self.pending = {}
+
+    def sign_day(self, now=None):
+        """当前所属的签到日（重置时间之前仍算前一天）"""
+        now = datetime.fromtimestamp(now or time.time(), SITE_TZ)
+        return (now - timedelta(hours=self.reset_hour)).strftime('%Y-%m-%d')
+
+    def cached(self, account):
+        """今日已签到且用户信息未过期时返回缓存的信息，否则返回 None"""
+        if not self.enabled:
+            return None
+        entry = self.pending.get(account) or self.entries.get(account)
+        if not entry or entry.get('day') != self.sign_day():
+            return None
+        if time.time() - entry.get('info_time', 0) > self.info_ttl:
+            return None
+        return entry.get('info') or {}
+
+    def record(self, account, info=None):
+        """记录账号今日已完成签到及当前用户信息"""
+        self.pending[account] = {
+            'day': self.sign_day(),
+            'info': info or {},
+            'info_time': int(time.time()),
+        }
+
+    def save(self):
+        """合并写回本次记录（跨进程加锁）"""
+        if not self.pending:
+            return
+        with store.file_lock(self.path):
+            entries = store.load_json(self.path)
+            entries.update(self.pending)
+            store.save_json(self.path, entries)
+        self.entries.update(self.pending)
+        self.pending = {}
@@ -0,0 +1,190 @@
+"""
+按主机自适应限速
+每个主机一个令牌桶，按 AIMD 调整速率：遇到 429/503、响应过慢或反爬页面时速率减半，
+响应正常时按固定步长缓慢提升；学到的速率保存在状态目录，下次运行沿用
+RateLimitAdapter 在请求发出前先取令牌（由 client.py 的共享适配器继承）
+必须准时发出的请求（如重置时刻的签到）放在 unthrottled() 块内：令牌照常扣除但不等待，并记录实际发出时刻
+"""
+import os
+import time
+import atexit
+import logging
+import threading
+import contextlib
+import contextvars
+from urllib.parse import urlparse
+
+from requests.adapters import HTTPAdapter
+
+import store
+
+logger = logging.getLogger(__name__)
+
+RATES_FILE = store.state_path('rate_limits.json')
+
+# 初始速率（每秒请求数）及上下限
+DEFAULT_RATE = float(os.environ.get('RATE_LIMIT_DEFAULT', '2'))
+MIN_RATE = 0.1
+MAX_RATE = float(os.environ.get('RATE_LIMIT_MAX', '10'))
+# 加性增、乘性减
+INCREASE_STEP = 0.1
+DECREASE_FACTOR = 0.5
+# 超过该耗时（秒）视为主机响应变慢
+SLOW_RESPONSE = 5.0
+THROTTLE_STATUS = (429, 503)
+# 反爬/限流页面特征（只检查响应开头部分）
+ANTI_BOT_MARKERS = ('Just a moment...', 'cf-chl-', '访问过于频繁', '请求过于频繁')
+ANTI_BOT_SCAN_BYTES = 4096
+
+
+class HostBucket:
+    """单个主机的令牌桶"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """预占一个令牌，返回需要等待的秒数（令牌可透支，按速率排队）"""
+        with self.lock:
+            now = time.monotonic()
+            capacity = max(1.0, self.rate)
+            self.tokens = min(capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.blocked_until - now)
+
+    def acquire(self):
+        """取一个令牌，不足时等待"""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    def increase(self):
+        with self.lock:
+            self.rate = min(MAX_RATE, self.rate + INCREASE_STEP)
+
+    def decrease(self, retry_after=None):
+        with self.lock:
+            self.rate = max(MIN_RATE, self.rate * DECREASE_FACTOR)
+            self.tokens = min(self.tokens, 0.0)
+            if retry_after:
+                self.blocked_until = time.monotonic() + retry_after
+
+
+class RateLimiter:
+    """按主机管理令牌桶，并持久化学到的速率"""
+
+    def __init__(self, path=RATES_FILE):
+        self.path = path
+        self.saved = store.load_json(path)
+        self.buckets = {}
+        self.lock = threading.Lock()
+        atexit.register(self.save)
+
+    def bucket(self, host):
+        with self.lock:
+            if host not in self.buckets:
+                rate = self.saved.get(host, {}).get('rate', DEFAULT_RATE)
+                self.buckets[host] = HostBucket(min(MAX_RATE, max(MIN_RATE, rate)))
+            return self.buckets[host]
+
+    def acquire(self, host):
+        self.bucket(host).acquire()
+
+    def reserve(self, host):
+        return self.bucket(host).reserve()
+
+    def feedback(self, host, status=None, elapsed=0.0, text='', retry_after=None):
+        """根据响应情况调整主机速率；status 为 None 表示连接失败"""
+        bucket = self.bucket(host)
+        if status in THROTTLE_STATUS:
+            reason = f"HTTP {status}"
+        elif any(marker in text for marker in ANTI_BOT_MARKERS):
+            reason = "疑似反爬页面"
+        elif status is None or elapsed > SLOW_RESPONSE:
+            reason = f"响应缓慢或失败（{elapsed:.1f}s）"
+        else:
+            bucket.increase()
+            return
+        bucket.decrease(retry_after)
+        logger.warning(f"{host} {reason}，限速降至 {bucket.rate:.2f} 次/秒")
+
+    def save(self):
+        """将本次用到的主机速率合并写回"""
+        if not self.buckets:
+            return
+        with store.file_lock(self.path):
+            saved = store.load_json(self.path)
+            for host, bucket in self.buckets.items():
+                saved[host] = {'rate': round(bucket.rate, 3), 'updated': int(time.time())}
+            store.save_json(self.path, saved)
+
+
+limiter = RateLimiter()
+
+# unthrottled() 块内为记录发出时刻的列表，块外为 None
+_exempt = contextvars.ContextVar('ratelimit_exempt', default=None)
+
+
+@contextlib.contextmanager
+def unthrottled(sent=None):
+    """块内发出的请求不等待令牌（透支由后续请求排队补足），产出记录各请求实际发出时刻的列表
+
+    sent 为已有的列表时沿用（供在其他线程/任务中执行的请求记录到同一列表）
+    """
+    sent = [] if sent is None else sent
+    token = _exempt.set(sent)
+    try:
+        yield sent
+    finally:
+        _exempt.reset(token)
+
+
+def exemption():
+    """当前所在 unthrottled() 块的发出时刻列表，不在块内时为 None"""
+    return _exempt.get()
+
+
+def reserve(host):
+    """预占令牌，返回需要等待的秒数；unthrottled() 块内记录发出时刻并返回 0"""
+    wait = limiter.reserve(host)
+    sent = _exempt.get()
+    if sent is None:
+        return wait
+    sent.append(time.time())
+    return 0.0
+
+
+def retry_after(response):
+    value = response.headers.get('Retry-After', '')
+    return float(value) if value.isdigit() else None
+
+
+class RateLimitAdapter(HTTPAdapter):
+    """发送前按主机取令牌，收到响应后反馈给限速器"""
+
+    def send(self, request, **kwargs):
+        host = urlparse(request.url).hostname
+        wait = reserve(host)
+        if wait > 0:
+            time.sleep(wait)
+        start = time.monotonic()
+        try:
+            response = super().send(request, **kwargs)
+        except Exception:
+            limiter.feedback(host, None, time.monotonic() - start)
+            raise
+
+        text = ''
+        content_type = response.headers.get('Content-Type', '')
+        if not kwargs.get('stream') and 'html' in content_type:
+            text = response.content[:ANTI_BOT_SCAN_BYTES].decode('utf-8', 'ignore')
+        limiter.feedback(
+            host, response.status_code, time.monotonic() - start, text, retry_after(response)
+        )
+        return response
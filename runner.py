@@ -0,0 +1,41 @@
+"""
+多账号并发执行器
+使用有界线程池并发处理账号，结果按输入顺序返回
+并发数由环境变量 SIGN_WORKERS 配置（默认 4，设为 1 即串行执行）
+可指定整体截止时间，超时未完成的任务以 on_timeout 的返回值代替；
+截止时间只限制结果汇总：已开始的任务无法中止，会继续运行到结束，
+解释器退出时 concurrent.futures 仍会等待这些线程（由请求超时与 SIGN_RUN_DEADLINE 限制其时长）
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
+
+WORKERS = int(os.environ.get('SIGN_WORKERS', '4'))
+
+
+def run_all(func, items, workers=None, timeout=None, on_timeout=None):
+    """以 func(*item) 并发处理 items，返回与 items 顺序一致的结果列表
+
+    timeout 到期时立即返回（尚未开始的任务取消，已开始的任务在后台继续运行）
+    """
+    items = list(items)
+    if not items:
+        return []
+    workers = max(1, min(workers or WORKERS, len(items)))
+    if workers == 1 and timeout is None:
+        return [func(*item) for item in items]
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='account')
+    try:
+        futures = [executor.submit(func, *item) for item in items]
+        wait(futures, timeout=timeout)
+        results = []
+        for item, future in zip(items, futures):
+            if future.done():
+                results.append(future.result())
+            else:
+                results.append(on_timeout(*item) if on_timeout else None)
+        return results
+    finally:
+        # 超时后不再等待未完成的任务，直接返回已有结果；未开始的任务取消，
+        # 运行中的任务无法中止，进程退出时仍会等待它们结束
+        executor.shutdown(wait=False, cancel_futures=True)
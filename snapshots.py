@@ -0,0 +1,85 @@
+"""
+按账号保存上次推送时的状态快照，用于仅在状态变化时推送
+NOTIFY_MODE=changes 开启变化推送模式（默认 all 每次都推送）
+NOTIFY_BALANCE_THRESHOLD 为余额变化的推送阈值，变化量超过该值才推送
+"""
+import os
+import time
+
+import store
+
+NOTIFY_MODE = os.environ.get('NOTIFY_MODE', 'all')
+BALANCE_THRESHOLD = float(os.environ.get('NOTIFY_BALANCE_THRESHOLD', '0'))
+
+# 账号状态
+SIGNED = 'signed'      # 本次签到成功
+ALREADY = 'already'    # 今日已签到
+FAILED = 'failed'      # 签到失败/请求异常
+EXPIRED = 'expired'    # Cookie或登录失效
+
+STATUS_LABELS = {
+    SIGNED: '新签到',
+    ALREADY: '今日已签到',
+    FAILED: '签到失败',
+    EXPIRED: '登录失效',
+}
+
+
+class ChangeTracker:
+    """对比账号本次结果与上次推送快照，给出需要推送的状态变化"""
+
+    def __init__(self, site, threshold=BALANCE_THRESHOLD, mode=None):
+        self.path = store.state_path(f'snapshot_{site}.json')
+        self.threshold = threshold
+        self.enabled = (mode or NOTIFY_MODE) == 'changes'
+        self.snapshots = store.load_json(self.path)
+        self.pending = {}
+
+    def diff(self, account, status, balance=None):
+        """返回相对上次推送快照的变化描述列表"""
+        prev = self.snapshots.get(account)
+        if prev is None:
+            return [STATUS_LABELS[status]]
+
+        changes = []
+        if status == SIGNED:
+            changes.append(STATUS_LABELS[SIGNED])
+        elif status != prev['status']:
+            if status in (FAILED, EXPIRED):
+                changes.append(STATUS_LABELS[status])
+            elif prev['status'] in (FAILED, EXPIRED):
+                changes.append('恢复正常')
+
+        prev_balance = prev.get('balance')
+        if balance is not None and prev_balance is not None and abs(balance - prev_balance) > self.threshold:
+            changes.append(f"余额变化 {prev_balance} → {balance}")
+        return changes
+
+    def check(self, account, status, balance=None):
+        """返回变化列表；需要推送时（未开启变化模式或存在变化）记录新快照"""
+        changes = self.diff(account, status, balance)
+        if changes or not self.enabled:
+            if balance is None:
+                # 失败时拿不到余额，保留上次的余额作为对比基准
+                balance = self.snapshots.get(account, {}).get('balance')
+            self.pending[account] = {
+                'status': status,
+                'balance': balance,
+                'time': int(time.time()),
+            }
+        return changes
+
+    def should_notify(self, account, status, balance=None):
+        """是否需要推送该账号的结果"""
+        return bool(self.check(account, status, balance)) or not self.enabled
+
+    def save(self):
+        """将已推送账号的快照合并写回（跨进程加锁）"""
+        if not self.pending:
+            return
+        with store.file_lock(self.path):
+            snapshots = store.load_json(self.path)
+            snapshots.update(self.pending)
+            store.save_json(self.path, snapshots)
+        self.snapshots.update(self.pending)
+        self.pending = {}
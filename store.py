@@ -0,0 +1,71 @@
+"""
+多脚本共享的本地状态存储
+提供状态目录、跨进程文件锁与JSON原子读写
+状态目录默认为脚本同级的 .sign_state，可通过环境变量 SIGN_STATE_DIR 修改
+"""
+import os
+import json
+import threading
+import contextlib
+import tempfile
+
+try:
+    import fcntl
+except ImportError:  # Windows 下退化为进程内锁
+    fcntl = None
+
+STATE_DIR = os.environ.get('SIGN_STATE_DIR') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '.sign_state'
+)
+
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+
+def state_path(name):
+    """返回状态目录下的文件路径"""
+    os.makedirs(STATE_DIR, exist_ok=True)
+    return os.path.join(STATE_DIR, name)
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """对指定文件加跨进程排他锁（锁文件为 path + '.lock'）"""
+    lock_path = os.path.abspath(path) + '.lock'
+    with _thread_locks_guard:
+        thread_lock = _thread_locks.setdefault(lock_path, threading.Lock())
+
+    with thread_lock:
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        with open(lock_path, 'a') as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def load_json(path, default=None):
+    """读取JSON文件，不存在或损坏时返回默认值"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {} if default is None else default
+
+
+def save_json(path, data):
+    """原子写入JSON文件，避免并发读取到半截内容"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+    except Exception:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_path)
+        raise
@@ -0,0 +1,178 @@
+"""
+每日重置时刻的定时签到
+SIGN_AT_RESET=on 时，若距下一次重置（SIGN_RESET_TIME，北京时间，默认 00:00:00）不超过 SIGN_PREWARM 秒，
+脚本先完成登录等准备工作并保持会话与连接预热，再在重置时刻发出签到请求
+（需另加一条在重置前几分钟运行的定时任务，如 cron: 57 23 * * *）
+- 服务器时钟偏移由多次 HEAD 请求的 Date 响应头估计：Date 只精确到秒，
+  通过让探测请求落在服务器秒跳变附近逐步收窄偏移区间，精度约为半个往返时间
+- 同一地址的各账号共用一次校时：先单次探测得到粗略偏移，临近重置时在剩余时间内完成多次探测
+- 签到请求按估计的单程耗时提前发出，使其在重置后 SIGN_RESET_MARGIN_MS 毫秒内到达服务器；
+  该请求不在主机令牌桶中排队等待（令牌照常扣除）
+- 每个账号报告实际到达时刻相对重置的偏差及偏移误差
+"""
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+
+import client
+import ledger
+import ratelimit
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get('SIGN_AT_RESET', 'off') == 'on'
+RESET_TIME = os.environ.get('SIGN_RESET_TIME', '00:00:00')
+# 最多提前多少秒开始准备（超过则按普通模式立即执行）
+PREWARM = float(os.environ.get('SIGN_PREWARM', '300'))
+# 请求到达服务器的目标时刻：重置后若干毫秒，避免因误差抢跑
+MARGIN = float(os.environ.get('SIGN_RESET_MARGIN_MS', '30')) / 1000
+# 等待期间保活请求的间隔（秒）、重新校时的提前量（秒）、最后阶段忙等的时长（秒）
+KEEPALIVE = 45
+RESYNC_BEFORE = 20
+SPIN = 0.02
+# 校时探测次数
+PROBES = 6
+
+
+def next_reset(now=None):
+    """下一次重置时刻（Unix 时间戳）"""
+    now = datetime.fromtimestamp(now or time.time(), ledger.SITE_TZ)
+    hour, minute, second = (int(part) for part in RESET_TIME.split(':'))
+    reset = now.replace(hour=hour, minute=minute, second=second, microsecond=0)
+    if reset <= now:
+        reset += timedelta(days=1)
+    return reset.timestamp()
+
+
+def pending_reset():
+    """定时模式开启且重置时刻临近时返回重置时间戳，否则返回 None"""
+    if not ENABLED:
+        return None
+    reset = next_reset()
+    return reset if reset - time.time() <= PREWARM else None
+
+
+class ServerClock:
+    """通过 Date 响应头估计服务器时钟偏移（服务器时间 = 本地时间 + offset）"""
+
+    def __init__(self, session, url):
+        self.session = session
+        self.url = url
+        self.low = float('-inf')
+        self.high = float('inf')
+        self.rtt = None
+
+    @property
+    def offset(self):
+        return (self.low + self.high) / 2
+
+    @property
+    def error(self):
+        return (self.high - self.low) / 2
+
+    def probe(self):
+        sent = time.time()
+        response = self.session.request('HEAD', self.url, timeout=client.timeout('info'))
+        received = time.time()
+        date = response.headers.get('Date')
+        if not date:
+            raise ValueError(f"{self.url} 未返回 Date 响应头")
+        server = parsedate_to_datetime(date).timestamp()
+        # 服务器在 [sent, received] 之间处理请求，其时间落在 [server, server + 1) 内
+        low, high = server - received, server + 1 - sent
+        if low > self.high or high < self.low:
+            # 与之前的区间矛盾（本地或服务器时钟被调整），以本次为准
+            self.low, self.high = low, high
+        else:
+            self.low, self.high = max(self.low, low), min(self.high, high)
+        self.rtt = min(self.rtt or received - sent, received - sent)
+
+    def sync(self, probes=PROBES, deadline=None):
+        """多次探测，让请求落在服务器秒跳变附近以收窄偏移区间
+        deadline 为本地时刻，探测来不及在其之前完成时提前结束"""
+        self.probe()
+        for _ in range(probes - 1):
+            # 下一个服务器整秒对应的本地时刻，使请求在该时刻到达服务器
+            tick = int(time.time() + self.offset) + 1
+            send_at = tick - self.offset - self.rtt / 2
+            while send_at - time.time() < 0.2:
+                send_at += 1
+            if deadline is not None and send_at + self.rtt > deadline:
+                break
+            sleep_until(send_at)
+            self.probe()
+        logger.debug(f"{self.url} 时钟偏移 {self.offset * 1000:+.0f}±{self.error * 1000:.0f}ms，往返 {self.rtt * 1000:.0f}ms")
+        return self
+
+
+def sleep_until(target, keepalive=None):
+    """等待到本地时刻 target；长时间等待时定期调用 keepalive，最后阶段忙等以保证精度"""
+    while True:
+        left = target - time.time()
+        if left <= 0:
+            return
+        if keepalive and left > KEEPALIVE:
+            time.sleep(KEEPALIVE)
+            keepalive()
+        elif left > SPIN:
+            time.sleep(left - SPIN)
+        # 剩余不足 SPIN 秒时忙等
+
+
+_clocks = {}
+_clocks_lock = threading.Lock()
+
+
+def _synced_clock(reset, session, url, keepalive=None):
+    """校时：先单次探测得到粗略偏移，等到重置前 RESYNC_BEFORE 秒，
+    再在剩余时间内多次探测（最后一次在签到请求发出前完成）"""
+    clock = ServerClock(session, url)
+    clock.probe()
+    sleep_until(reset - clock.offset - RESYNC_BEFORE, keepalive)
+    return clock.sync(deadline=reset - clock.offset - clock.rtt)
+
+
+def shared_clock(reset, session, url, keepalive=None):
+    """同一地址、同一重置时刻只校时一次，其余账号等待结果（期间照常保活）"""
+    key = (url, reset)
+    with _clocks_lock:
+        entry = _clocks.get(key)
+        owner = entry is None
+        if owner:
+            entry = _clocks[key] = {'ready': threading.Event(), 'clock': None}
+    if owner:
+        try:
+            entry['clock'] = _synced_clock(reset, session, url, keepalive)
+        finally:
+            entry['ready'].set()
+    else:
+        while not entry['ready'].wait(KEEPALIVE):
+            if keepalive:
+                keepalive()
+    if entry['clock'] is None:
+        # 负责校时的账号失败，自行单次探测
+        return _synced_clock(reset, session, url, keepalive)
+    return entry['clock']
+
+
+def fire_at(reset, session, url, send, keepalive=None):
+    """在重置时刻发出签到请求，返回 (响应, 到达偏差描述)
+
+    url 为用于校时的同主机地址；send 为发出签到请求的无参函数（在调用线程上发出，不经限速等待）；
+    keepalive 用于长时间等待时保持登录态与连接
+    """
+    clock = shared_clock(reset, session, url, keepalive)
+    fire = reset - clock.offset - clock.rtt / 2 + max(MARGIN, clock.error)
+    sleep_until(fire, keepalive)
+    # 各账号同时发出，不在主机令牌桶中排队；发出时刻由适配器在请求实际发出时记录
+    called = time.time()
+    with ratelimit.unthrottled() as sent:
+        response = send()
+    # 请求到达服务器的时刻按发出时刻加半个往返估计
+    skew = ((sent[0] if sent else called) + clock.rtt / 2 + clock.offset - reset) * 1000
+    note = f"{skew:+.0f}ms（时钟偏移 {clock.offset * 1000:+.0f}±{clock.error * 1000:.0f}ms）"
+    logger.info(f"{clock.url} 重置后 {note} 发出签到")
+    return response, note
@@ -4,23 +4,19 @@
 """
 import time
 import re
-import json
-import base64
-import hashlib
-import urllib.parse
-import hmac
-import rsa
-import requests
-import random
 import os
+
+import wecom
+import runner
+import client
+import ledger
+import vault
+import rsacrypt
+import extract
 """
 cron: 0 7,19 * * *
 name: 天翼云盘签到
 """
-BI_RM = list("0123456789abcdefghijklmnopqrstuvwxyz")
-
-B64MAP = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
-
 # 企业微信应用配置
 WECOM_CORPID = os.getenv('WECOM_CORPID', '')
 WECOM_SECRET = os.getenv('WECOM_SECRET', '')
@@ -29,56 +25,39 @@ WECOM_AGENTID = os.getenv('WECOM_AGENTID', '')
 if not WECOM_CORPID or not WECOM_SECRET or not WECOM_AGENTID:
     print("企业微信应用配置不完整，签到结果将不会通过企业微信发送")
 
-def int2char(a):
-    return BI_RM[a]
-
-def b64tohex(a):
-    d = ""
-    e = 0
-    c = 0
-    for i in range(len(a)):
-        if list(a)[i] != "=":
-            v = B64MAP.index(list(a)[i])
-            if 0 == e:
-                e = 1
-                d += int2char(v >> 2)
-                c = 3 & v
-            elif 1 == e:
-                e = 2
-                d += int2char(c << 2 | v >> 4)
-                c = 15 & v
-            elif 2 == e:
-                e = 3
-                d += int2char(c)
-                d += int2char(v >> 2)
-                c = 3 & v
-            else:
-                e = 0
-                d += int2char(c << 2 | v >> 4)
-                d += int2char(15 & v)
-    if e == 1:
-        d += int2char(c << 2)
-    return d
-
-def rsa_encode(j_rsakey, string):
-    rsa_key = f"-----BEGIN PUBLIC KEY-----\n{j_rsakey}\n-----END PUBLIC KEY-----"
-    pubkey = rsa.PublicKey.load_pkcs1_openssl_pem(rsa_key.encode())
-    result = b64tohex((base64.b64encode(rsa.encrypt(f'{string}'.encode(), pubkey))).decode())
-    return result
+sign_ledger = ledger.SignLedger('tyyp')
+
+# 各账号登录后的 Cookie（加密保存），下次运行直接复用，失效时才走完整登录流程
+cookie_store = vault.CookieStore('tyyp')
+
+# udb_login.jsp 最多读取的字节数
+UDB_LOGIN_SCAN_LIMIT = 32 * 1024
+
+def find_redirect_url(text):
+    match = re.search(r"https?://[^\s'\"]+(?=[\s'\"])", text)
+    return match.group() if match else None
+
+# 登录页中的表单参数与 RSA 公钥，一次扫描取出
+LOGIN_FIELD_NAMES = ('captchaToken', 'lt', 'returnUrl', 'paramId', 'j_rsakey')
+LOGIN_FIELDS = extract.Extractor([
+    extract.Field('captchaToken', r"captchaToken' value='(.+?)'"),
+    extract.Field('lt', r'lt = "(.+?)"'),
+    extract.Field('returnUrl', r"returnUrl= '(.+?)'"),
+    extract.Field('paramId', r'paramId = "(.+?)"'),
+    extract.Field('j_rsakey', r'j_rsaKey" value="(\S+)"'),
+])
 
 def login(username, password):
     url = ""
     urlToken = "https://m.cloud.189.cn/udb/udb_login.jsp?pageId=1&pageKey=default&clientType=wap&redirectURL=https://m.cloud.189.cn/zhuanti/2021/shakeLottery/index.html"
-    s = requests.Session()
-    r = s.get(urlToken)
-    pattern = r"https?://[^\s'\"]+"
-    match = re.search(pattern, r.text)
-    if match:
-        url = match.group()
-    else:
+    s = client.new_session()
+    # 跳转地址位于页面开头，流式读取到完整地址（其后出现引号或空白）即停止
+    r, url = client.scan(s, urlToken, find_redirect_url, phase='login', max_bytes=UDB_LOGIN_SCAN_LIMIT)
+    if not url:
+        url = ""
         print("没有找到url")
 
-    r = s.get(url)
+    r = client.get(s, url, phase='login')
     pattern = r"<a id=\"j-tab-login-link\"[^>]*href=\"([^\"]+)\""
     match = re.search(pattern, r.text)
     if match:
@@ -86,19 +65,19 @@ def login(username, password):
     else:
         print("没有找到href链接")
 
-    r = s.get(href)
-    captchaToken = re.findall(r"captchaToken' value='(.+?)'", r.text)[0]
-    lt = re.findall(r'lt = "(.+?)"', r.text)[0]
-    returnUrl = re.findall(r"returnUrl= '(.+?)'", r.text)[0]
-    paramId = re.findall(r'paramId = "(.+?)"', r.text)[0]
-    j_rsakey = re.findall(r'j_rsaKey" value="(\S+)"', r.text, re.M)[0]
+    r = client.get(s, href, phase='login')
+    fields = LOGIN_FIELDS.extract(r.text, name='tyyp_logbox')
+    missing = [name for name in LOGIN_FIELD_NAMES if name not in fields]
+    if missing:
+        raise Exception(f"登录页缺少字段：{', '.join(missing)}")
+    captchaToken, lt, returnUrl, paramId, j_rsakey = (fields[name] for name in LOGIN_FIELD_NAMES)
     s.headers.update({"lt": lt})
 
-    username = rsa_encode(j_rsakey, username)
-    password = rsa_encode(j_rsakey, password)
+    username = rsacrypt.encrypt_hex(j_rsakey, username)
+    password = rsacrypt.encrypt_hex(j_rsakey, password)
     url = "https://open.e.189.cn/api/logbox/oauth2/loginSubmit.do"
     headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:74.0) Gecko/20100101 Firefox/76.0',
+        'User-Agent': client.FIREFOX_UA,
         'Referer': 'https://open.e.189.cn/',
     }
     data = {
@@ -112,68 +91,77 @@ def login(username, password):
         "mailSuffix": "@189.cn",
         "paramId": paramId
     }
-    r = s.post(url, data=data, headers=headers, timeout=5)
+    r = s.post(url, data=data, headers=headers, timeout=client.timeout('login'))
     if (r.json()['result'] == 0):
         print(r.json()['msg'])
     else:
         print(r.json()['msg'])
     redirect_url = r.json()['toUrl']
-    r = s.get(redirect_url)
+    r = s.get(redirect_url, timeout=client.timeout('login'))
     return s
 
-def get_wecom_access_token():
-    url = f"https://qyapi.weixin.qq.com/cgi-bin/gettoken?corpid={WECOM_CORPID}&corpsecret={WECOM_SECRET}"
-    response = requests.get(url)
-    return response.json().get('access_token')
-
 def send_wecom_message(content):
     if not WECOM_CORPID or not WECOM_SECRET or not WECOM_AGENTID:
         print("企业微信配置不完整，跳过消息推送")
         return
     
-    access_token = get_wecom_access_token()
-    if not access_token:
-        print("获取企业微信access_token失败")
-        return
-    
-    url = f"https://qyapi.weixin.qq.com/cgi-bin/message/send?access_token={access_token}"
-    data = {
-        "touser": "@all",
-        "msgtype": "text",
-        "agentid": WECOM_AGENTID,
-        "text": {
-            "content": content
-        },
-        "safe": 0
-    }
-    
-    response = requests.post(url, json=data)
-    result = response.json()
-    if result.get('errcode') == 0:
-        print("企业微信消息推送成功")
+    if wecom.notify(content, source='tyyp'):
+        print("企业微信消息已加入推送队列")
     else:
-        print(f"企业微信消息推送失败: {result.get('errmsg')}")
+        print("企业微信消息入队失败")
+
+def user_sign(s):
+    """调用签到接口，返回响应 JSON；登录态无效时返回 None"""
+    rand = str(round(time.time() * 1000))
+    surl = f'https://api.cloud.189.cn/mkt/userSign.action?rand={rand}&clientType=TELEANDROID&version=8.6.3&model=SM-G930K'
+    headers = {
+        'User-Agent': client.ECLOUD_UA,
+        "Referer": "https://m.cloud.189.cn/zhuanti/2016/sign/index.jsp?albumBackupOpened=1",
+        "Host": "m.cloud.189.cn",
+        "Accept-Encoding": "gzip, deflate",
+    }
+    response = s.get(surl, headers=headers, timeout=client.timeout('sign'))
+    try:
+        data = response.json()
+    except ValueError:
+        return None
+    return data if 'netdiskBonus' in data else None
+
+def saved_session(username):
+    """用保存的 Cookie 创建会话，没有保存时返回 None"""
+    s = client.new_session()
+    return s if cookie_store.restore(username, s) else None
 
 def process_account(username, password):
     result = []
+    # 今日已签到，直接使用台账缓存
+    cached = sign_ledger.cached(username)
+    if cached:
+        res = f"账号 {username[:3]}****{username[-4:]} 今日已签到（缓存），获得 {cached['bonus']}M 空间"
+        result.append(res)
+        print(res)
+        return result
+
     try:
-        s = login(username, password)
-        rand = str(round(time.time() * 1000))
-        surl = f'https://api.cloud.189.cn/mkt/userSign.action?rand={rand}&clientType=TELEANDROID&version=8.6.3&model=SM-G930K'
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Linux; Android 5.1.1; SM-G930K Build/NRD90M; wv) AppleWebKit/537.36 (KHTML, like Gecko) Version/4.0 Chrome/74.0.3729.136 Mobile Safari/537.36 Ecloud/8.6.3 Android/22 clientId/355325117317828 clientModel/SM-G930K imsi/460071114317824 clientChannelId/qq proVersion/1.0.6',
-            "Referer": "https://m.cloud.189.cn/zhuanti/2016/sign/index.jsp?albumBackupOpened=1",
-            "Host": "m.cloud.189.cn",
-            "Accept-Encoding": "gzip, deflate",
-        }
-        
-        # 签到
-        response = s.get(surl, headers=headers)
-        netdiskBonus = response.json()['netdiskBonus']
-        if response.json()['isSign'] == "false":
+        # 先用保存的登录态直接签到（签到接口同时用于校验登录态），失效时再完整登录
+        s = saved_session(username)
+        data = user_sign(s) if s else None
+        if data is None:
+            if s:
+                print(f"账号 {username[:3]}****{username[-4:]} 保存的登录态已失效，重新登录")
+            s = login(username, password)
+            data = user_sign(s)
+            if data is None:
+                raise ValueError("登录后签到接口仍未返回签到结果")
+        # 保存最新的 Cookie（服务端可能已续期）
+        cookie_store.save(username, s)
+
+        netdiskBonus = data['netdiskBonus']
+        if data['isSign'] == "false":
             res = f"账号 {username[:3]}****{username[-4:]} 签到成功，获得 {netdiskBonus}M 空间"
         else:
             res = f"账号 {username[:3]}****{username[-4:]} 已签到，获得 {netdiskBonus}M 空间"
+        sign_ledger.record(username, {'bonus': netdiskBonus})
         result.append(res)
         print(res)
         
@@ -193,21 +181,28 @@ def main():
         print("账号密码配置错误，请检查环境变量 ty_username 和 ty_password")
         return
     
-    all_results = []
+    report = wecom.Report("天翼云签到结果汇总:")
+    accounts = []
     for i in range(len(usernames)):
         username = usernames[i].strip()
         password = passwords[i].strip()
         if not username or not password:
             continue
-            
+        accounts.append((username, password))
+
+    def worker(username, password):
         print(f"\n正在处理账号 {username[:3]}****{username[-4:]}")
-        account_results = process_account(username, password)
-        all_results.extend(account_results)
+        return process_account(username, password)
+
+    # 并发处理所有账号，结果保持输入顺序
+    for account_results in runner.run_all(worker, accounts):
+        for line in account_results:
+            report.add(line, ok="签到失败" not in line)
+    sign_ledger.save()
     
     # 发送汇总通知
-    if all_results and WECOM_CORPID and WECOM_SECRET and WECOM_AGENTID:
-        message = "天翼云签到结果汇总:\n" + "\n".join(all_results)
-        send_wecom_message(message)
+    if report.total and WECOM_CORPID and WECOM_SECRET and WECOM_AGENTID:
+        send_wecom_message(report)
 
 def lambda_handler(event, context):  # aws default
     main()
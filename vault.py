@@ -0,0 +1,162 @@
+"""
+加密保存的登录凭据（令牌、Cookie 等）
+凭据以 Fernet（AES-CBC + HMAC）加密后写入状态目录下的 <name>.vault.json
+密钥取自环境变量 SIGN_STATE_KEY（Fernet 密钥），未设置时在状态目录生成 .vault_key（仅本用户可读）
+未安装 cryptography 时不落盘任何凭据，各脚本照常每次重新登录
+dump_cookies/restore_cookies 用于保存、恢复会话的 Cookie（requests 与 asyncio 引擎的会话均可），
+CookieStore 在此基础上按站点、账号管理会话的持久化
+"""
+import os
+import json
+import time
+import atexit
+import base64
+import logging
+import threading
+
+from requests.cookies import create_cookie
+
+import store
+
+logger = logging.getLogger(__name__)
+
+KEY_FILE = store.state_path('.vault_key')
+
+_fernet = None
+
+
+def _cipher():
+    """返回 Fernet 实例；cryptography 不可用时返回 None"""
+    global _fernet
+    if _fernet is None:
+        try:
+            from cryptography.fernet import Fernet
+        except ImportError:
+            logger.warning("未安装 cryptography，登录凭据不会保存")
+            _fernet = False
+            return None
+        _fernet = Fernet(_key())
+    return _fernet or None
+
+
+def _key():
+    key = os.environ.get('SIGN_STATE_KEY')
+    if key:
+        return key.encode()
+    with store.file_lock(KEY_FILE):
+        if not os.path.exists(KEY_FILE):
+            fd = os.open(KEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(base64.urlsafe_b64encode(os.urandom(32)))
+        with open(KEY_FILE, 'rb') as f:
+            return f.read().strip()
+
+
+def _path(name):
+    return store.state_path(f'{name}.vault.json')
+
+
+def _decrypt(cipher, entries):
+    from cryptography.fernet import InvalidToken
+    result = {}
+    for account, token in entries.items():
+        try:
+            result[account] = json.loads(cipher.decrypt(token.encode()))
+        except (InvalidToken, ValueError):
+            # 密钥更换或内容损坏，丢弃该条目
+            logger.warning(f"{account} 的凭据无法解密，已忽略")
+    return result
+
+
+def load(name):
+    """读取并解密凭据，返回 {账号: 数据}"""
+    cipher = _cipher()
+    if not cipher:
+        return {}
+    return _decrypt(cipher, store.load_json(_path(name)))
+
+
+def update(name, changes):
+    """加密并合并写入凭据；值为 None 表示删除该账号"""
+    cipher = _cipher()
+    if not cipher or not changes:
+        return
+    path = _path(name)
+    with store.file_lock(path):
+        entries = store.load_json(path)
+        for account, data in changes.items():
+            if data is None:
+                entries.pop(account, None)
+            else:
+                entries[account] = cipher.encrypt(json.dumps(data).encode()).decode()
+        store.save_json(path, entries)
+
+
+def _jar(session):
+    # httpx.Cookies 通过 .jar 暴露底层 CookieJar，requests 的 cookies 本身即 CookieJar
+    return getattr(session.cookies, 'jar', session.cookies)
+
+
+def dump_cookies(session):
+    """导出会话中的 Cookie 为可序列化的列表"""
+    return [
+        {
+            'name': cookie.name,
+            'value': cookie.value,
+            'domain': cookie.domain,
+            'path': cookie.path,
+            'expires': cookie.expires,
+            'secure': cookie.secure,
+        }
+        for cookie in _jar(session)
+    ]
+
+
+def restore_cookies(session, cookies):
+    """将导出的 Cookie 恢复到会话中（跳过已过期的）"""
+    jar = _jar(session)
+    now = time.time()
+    for cookie in cookies:
+        if cookie.get('expires') and cookie['expires'] < now:
+            continue
+        jar.set_cookie(create_cookie(**cookie))
+
+
+class CookieStore:
+    """按站点加密保存各账号会话的 Cookie，下次运行恢复后复用登录态
+
+    各账号的变化在退出时合并写回（跨进程加锁），多个定时任务同时运行也不会互相覆盖
+    """
+
+    def __init__(self, site):
+        self.name = f'{site}_sessions'
+        self.saved = load(self.name)
+        self.changes = {}
+        self.lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def restore(self, account, session):
+        """将保存的 Cookie 恢复到会话中，没有保存时返回 False"""
+        cookies = self.saved.get(account)
+        if not cookies:
+            return False
+        restore_cookies(session, cookies)
+        return True
+
+    def save(self, account, session):
+        """记录账号当前的 Cookie（登录成功或复用成功后调用）"""
+        with self.lock:
+            self.changes[account] = self.saved[account] = dump_cookies(session)
+
+    def discard(self, account, session=None):
+        """登录态已失效：删除保存的 Cookie 并清空会话"""
+        with self.lock:
+            self.saved.pop(account, None)
+            self.changes[account] = None
+        if session is not None:
+            session.cookies.clear()
+
+    def flush(self):
+        with self.lock:
+            changes, self.changes = self.changes, {}
+        update(self.name, changes)
@@ -0,0 +1,407 @@
+"""
+企业微信应用消息公共模块
+所有脚本共用同一份 access_token 缓存（跨进程文件锁保护），
+在过期前提前刷新，接口返回 40014/42001 时作废重取
+
+notify() 只把消息写入磁盘发件箱，由后台线程在合并窗口结束后统一发送：
+同一窗口内（含其他脚本进程）的消息合并为一次推送，按页判定结果，
+未送达的分块保留到下次运行（已送达的分块不再重发，续发部分标题后注明“续”）
+
+文本消息上限 2048 字节：Report 按账号分块累积，发送时在账号边界处分页，
+各页并发发送并带页码；WECOM_REPORT_MODE=compact 时只推送汇总与失败账号
+"""
+import os
+import time
+import uuid
+import atexit
+import hashlib
+import logging
+import threading
+
+import store
+import client
+
+logger = logging.getLogger(__name__)
+
+# 通知多在进程退出阶段发送，不受整次运行截止时间限制（各请求仍有自身的超时）
+_session = client.new_session(deadline=False)
+
+TOKEN_URL = "https://qyapi.weixin.qq.com/cgi-bin/gettoken"
+SEND_URL = "https://qyapi.weixin.qq.com/cgi-bin/message/send"
+
+TOKEN_CACHE_FILE = store.state_path('wecom_token.json')
+# access_token 失效/过期的错误码
+TOKEN_INVALID_CODES = (40014, 42001)
+# 提前刷新的秒数
+TOKEN_REFRESH_MARGIN = 300
+
+OUTBOX_FILE = store.state_path('wecom_outbox.json')
+# 合并窗口（秒）：首条消息入队后等待该时长再统一发送
+MERGE_WINDOW = float(os.environ.get('WECOM_MERGE_WINDOW', '15'))
+# 发件箱消息最长保留时间，超时未发出则丢弃
+OUTBOX_TTL = 86400
+# 被其他进程领取后超过该时长仍未确认，视为领取进程已退出
+CLAIM_TIMEOUT = 120
+# 进程退出时等待后台发送完成的最长时间
+FLUSH_TIMEOUT = 60
+
+# 文本消息内容上限（字节）
+TEXT_LIMIT = 2048
+# 为页码预留的字节数
+PAGE_MARK_RESERVE = 32
+# 分页并发发送的线程数
+SEND_WORKERS = 4
+# 报告模式：full 全部账号 / compact 仅汇总与失败账号
+REPORT_MODE = os.environ.get('WECOM_REPORT_MODE', 'full')
+
+
+def get_config():
+    """从环境变量读取企业微信配置"""
+    return (
+        os.environ.get('WECOM_CORPID'),
+        os.environ.get('WECOM_SECRET'),
+        os.environ.get('WECOM_AGENTID'),
+    )
+
+
+def _cache_key(corpid, secret):
+    # 缓存文件中不保存明文secret
+    return hashlib.sha256(f"{corpid}:{secret}".encode()).hexdigest()[:16]
+
+
+def get_access_token(corpid, secret, force_refresh=False):
+    """获取access_token，优先使用未过期的缓存"""
+    key = _cache_key(corpid, secret)
+    with store.file_lock(TOKEN_CACHE_FILE):
+        cache = store.load_json(TOKEN_CACHE_FILE)
+        entry = cache.get(key)
+        if not force_refresh and entry and entry['expires_at'] - TOKEN_REFRESH_MARGIN > time.time():
+            return entry['access_token']
+
+        try:
+            data = _session.get(
+                TOKEN_URL, params={'corpid': corpid, 'corpsecret': secret}, timeout=10
+            ).json()
+        except Exception as e:
+            logger.error(f"获取token异常: {str(e)}")
+            return None
+        if data.get('errcode') != 0:
+            logger.error(f"获取token失败: {data}")
+            return None
+
+        cache[key] = {
+            'access_token': data['access_token'],
+            'expires_at': time.time() + data.get('expires_in', 7200),
+        }
+        store.save_json(TOKEN_CACHE_FILE, cache)
+        return data['access_token']
+
+
+def invalidate_token(corpid, secret, access_token):
+    """作废缓存中的指定token（仅当缓存仍是该token时）"""
+    key = _cache_key(corpid, secret)
+    with store.file_lock(TOKEN_CACHE_FILE):
+        cache = store.load_json(TOKEN_CACHE_FILE)
+        if cache.get(key, {}).get('access_token') == access_token:
+            cache.pop(key)
+            store.save_json(TOKEN_CACHE_FILE, cache)
+
+
+def send_text(content, corpid=None, secret=None, agentid=None, touser='@all'):
+    """发送文本消息，token失效时自动刷新重发一次"""
+    env_corpid, env_secret, env_agentid = get_config()
+    corpid = corpid or env_corpid
+    secret = secret or env_secret
+    agentid = agentid or env_agentid
+    if not all([corpid, secret, agentid]):
+        logger.error("企业微信配置不完整")
+        return False
+
+    payload = {
+        "touser": touser,
+        "msgtype": "text",
+        "agentid": agentid,
+        "text": {"content": content},
+        "safe": 0
+    }
+    for _ in range(2):
+        access_token = get_access_token(corpid, secret)
+        if not access_token:
+            return False
+        try:
+            result = _session.post(
+                SEND_URL, params={'access_token': access_token}, json=payload, timeout=10
+            ).json()
+        except Exception as e:
+            logger.error(f"推送请求异常: {str(e)}")
+            return False
+
+        if result.get('errcode') == 0:
+            return True
+        if result.get('errcode') in TOKEN_INVALID_CODES:
+            logger.warning(f"access_token已失效，重新获取: {result.get('errmsg')}")
+            invalidate_token(corpid, secret, access_token)
+            continue
+        logger.error(f"推送失败: {result}")
+        return False
+    return False
+
+
+def _byte_len(text):
+    return len(text.encode('utf-8'))
+
+
+def _split_block(block, limit):
+    """将超长分块按行（必要时按字节）切开"""
+    part, size = [], 0
+    for line in block.split('\n'):
+        while _byte_len(line) > limit:
+            head = line.encode('utf-8')[:limit].decode('utf-8', 'ignore')
+            if part:
+                yield '\n'.join(part)
+                part, size = [], 0
+            yield head
+            line = line[len(head):]
+        line_size = _byte_len(line) + 1
+        if part and size + line_size > limit:
+            yield '\n'.join(part)
+            part, size = [], 0
+        part.append(line)
+        size += line_size
+    if part:
+        yield '\n'.join(part)
+
+
+def _paginate(items, limit):
+    """items 为 (owner, block)，返回 (页面文本, 该页包含的 owner 集合)"""
+    limit -= PAGE_MARK_RESERVE
+    page, owners, size = [], set(), 0
+    for owner, block in items:
+        for piece in _split_block(block, limit):
+            piece_size = _byte_len(piece) + 1
+            if page and size + piece_size > limit:
+                yield '\n'.join(page), owners
+                page, owners, size = [], set(), 0
+            page.append(piece)
+            owners.add(owner)
+            size += piece_size
+    if page:
+        yield '\n'.join(page), owners
+
+
+def paginate(blocks, limit=TEXT_LIMIT):
+    """按分块边界切分页面，每页（含页码）不超过 limit 字节"""
+    for page, _ in _paginate(((None, block) for block in blocks), limit):
+        yield page
+
+
+def send_pages(pages, workers=SEND_WORKERS):
+    """并发发送多页消息，多于一页时追加页码；返回与页面顺序一致的结果列表
+
+    由后台发送线程在进程退出阶段调用时，concurrent.futures 已不再接受新任务，
+    因此按批启动普通线程并等待其结束
+    """
+    pages = list(pages)
+    if len(pages) > 1:
+        pages = [f"{page}\n（第{i}/{len(pages)}页）" for i, page in enumerate(pages, 1)]
+    if len(pages) <= 1:
+        return [send_text(page) for page in pages]
+    results = [False] * len(pages)
+
+    def send(index):
+        results[index] = send_text(pages[index])
+
+    for start in range(0, len(pages), workers):
+        threads = [
+            threading.Thread(target=send, args=(i,), name='wecom-page')
+            for i in range(start, min(start + workers, len(pages)))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return results
+
+
+class Report:
+    """流式报告构建器：逐个账号追加结果分块，避免反复拼接整段字符串"""
+
+    def __init__(self, title, mode=None):
+        self.title = title
+        self.mode = mode or REPORT_MODE
+        self.header = []
+        self.blocks = []
+        self.total = 0
+        self.failed = 0
+
+    def add_header(self, text):
+        """追加报告头部信息（时间、站点等），各模式均保留"""
+        self.header.append(text)
+
+    def add(self, block, ok=True):
+        """追加一个账号的结果；compact 模式下丢弃成功账号的明细"""
+        self.total += 1
+        if not ok:
+            self.failed += 1
+        if self.mode == 'compact' and ok:
+            return
+        self.blocks.append(block)
+
+    def summary(self):
+        return f"共 {self.total} 个账号，成功 {self.total - self.failed} 个，失败 {self.failed} 个"
+
+    def render(self):
+        """返回报告分块列表（标题与头部在前）"""
+        blocks = [self.title, *self.header]
+        if self.mode == 'compact':
+            blocks.append(self.summary())
+            if self.blocks:
+                blocks.append("失败账号：")
+        return blocks + self.blocks
+
+    def __str__(self):
+        return '\n'.join(self.render())
+
+
+def enqueue(content, source=None):
+    """将消息（字符串或 Report）写入磁盘发件箱"""
+    blocks = content.render() if isinstance(content, Report) else [content]
+    # 超长分块预先切开，使每个分块都能放进一页，失败重发以分块为单位
+    pieces = [piece for block in blocks for piece in _split_block(block, TEXT_LIMIT - PAGE_MARK_RESERVE)]
+    message = {
+        'id': uuid.uuid4().hex,
+        'created': time.time(),
+        'source': source,
+        'title': blocks[0].split('\n', 1)[0],
+        'blocks': pieces,
+        'attempts': 0,
+        'claimed_at': 0,
+    }
+    with store.file_lock(OUTBOX_FILE):
+        outbox = store.load_json(OUTBOX_FILE, [])
+        outbox.append(message)
+        store.save_json(OUTBOX_FILE, outbox)
+    return message['id']
+
+
+def drain_outbox():
+    """领取发件箱中所有待发消息，合并分页后推送；未送达的分块放回等待下次发送"""
+    now = time.time()
+    with store.file_lock(OUTBOX_FILE):
+        outbox = store.load_json(OUTBOX_FILE, [])
+        pending = []
+        batch = []
+        for message in outbox:
+            if now - message['created'] > OUTBOX_TTL:
+                logger.warning(f"发件箱消息超时丢弃: {message['blocks'][0][:50]}")
+                continue
+            pending.append(message)
+            if now - message['claimed_at'] > CLAIM_TIMEOUT:
+                message['claimed_at'] = now
+                batch.append(message)
+        store.save_json(OUTBOX_FILE, pending)
+
+    if not batch:
+        return True
+
+    batch.sort(key=lambda m: m['created'])
+    # 消息之间空一行；记录每页包含哪些消息的哪些分块，用于按页判定发送结果
+    items = []
+    for message in batch:
+        for i, block in enumerate(message['blocks']):
+            items.append(((message['id'], i), f"\n{block}" if items and i == 0 else block))
+    pages, page_owners = [], []
+    for page, owners in _paginate(items, TEXT_LIMIT):
+        pages.append(page)
+        page_owners.append(owners)
+
+    try:
+        results = send_pages(pages)
+    except Exception as e:
+        # 发送过程异常时整批放回发件箱，不等待领取超时
+        logger.error(f"发件箱发送异常: {str(e)}")
+        results = [False] * len(pages)
+    failed = set()
+    for owners, ok in zip(page_owners, results):
+        if not ok:
+            failed |= owners
+    failed_ids = {message_id for message_id, _ in failed}
+
+    with store.file_lock(OUTBOX_FILE):
+        outbox = store.load_json(OUTBOX_FILE, [])
+        sent_ids = {m['id'] for m in batch} - failed_ids
+        outbox = [m for m in outbox if m['id'] not in sent_ids]
+        for message in outbox:
+            if message['id'] not in failed_ids:
+                continue
+            # 只保留未送达的分块；标题已送达时以“标题（续）”开头
+            blocks = [block for i, block in enumerate(message['blocks']) if (message['id'], i) in failed]
+            if (message['id'], 0) not in failed:
+                title = message.get('title') or message['blocks'][0].split('\n', 1)[0]
+                blocks.insert(0, f"{title}（续）")
+            message['blocks'] = blocks
+            message['claimed_at'] = 0
+            message['attempts'] += 1
+        store.save_json(OUTBOX_FILE, outbox)
+
+    if failed_ids:
+        logger.error(f"发件箱推送失败，{len(failed_ids)} 条消息的 {len(failed)} 个分块保留至下次发送")
+    else:
+        logger.info(f"发件箱推送成功，合并 {len(batch)} 条消息，共 {len(pages)} 页")
+    return not failed_ids
+
+
+class Dispatcher:
+    """后台发送线程：合并窗口结束后清空发件箱，进程退出前等待发送完成"""
+
+    def __init__(self, window=MERGE_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._thread = None
+        self._dirty = False
+        self._registered = False
+
+    def wake(self):
+        """有新消息入队时调用，按需启动后台线程"""
+        with self._lock:
+            self._dirty = True
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='wecom-outbox', daemon=True)
+                self._thread.start()
+            if not self._registered:
+                atexit.register(self.flush)
+                self._registered = True
+
+    def _run(self):
+        while True:
+            time.sleep(self.window)
+            with self._lock:
+                self._dirty = False
+            try:
+                drain_outbox()
+            except Exception as e:
+                logger.error(f"发件箱发送异常: {str(e)}")
+            with self._lock:
+                if not self._dirty:
+                    self._thread = None
+                    return
+
+    def flush(self, timeout=FLUSH_TIMEOUT):
+        """等待后台线程发送完毕"""
+        thread = self._thread
+        if thread is not None:
+            thread.join(self.window + timeout)
+
+
+dispatcher = Dispatcher()
+
+
+def notify(content, source=None):
+    """异步推送：写入发件箱后立即返回，由后台线程合并发送"""
+    try:
+        enqueue(content, source)
+    except Exception as e:
+        logger.error(f"写入发件箱失败: {str(e)}")
+        return False
+    dispatcher.wake()
+    return True
@@ -1,15 +1,22 @@
 import os
-import requests
+import time
+import json
 import logging
 import re
-import time
-import random
 import hashlib
-import json
+import threading
+import contextlib
+import functools
 from datetime import datetime
-from bs4 import BeautifulSoup
-from pyquery import PyQuery as pq
-import xml.etree.ElementTree as ET
+from urllib.parse import urlparse
+
+import wecom
+import store
+import runner
+import client
+import timing
+import vault
+import extract
 """
 cron: 0 30 7,15 * * *
 name: 整合签到平台
@@ -32,399 +39,376 @@ setup_logging()
 logger = logging.getLogger(__name__)
 
 class BaseSigner:
-    LAST_COINS_FILE = "last_coins.json"
+    LAST_COINS_FILE = store.state_path("last_coins.json")
+    # 旧版写在当前工作目录下的记录，状态目录中没有记录时读取
+    LEGACY_LAST_COINS_FILE = "last_coins.json"
+    # 各平台账号的登录 Cookie（加密保存，cookietime 为 30 天）
+    cookie_store = vault.CookieStore('zhqd')
     
-    def __init__(self):
-        self.session = requests.Session()
-        self.headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        }
-        self.result_template = (
-            "· 执行时间: {time}\n"
-            "· 执行状态: {status}\n"
-            "· 用户账号: {username}\n"
-            "· 当前金币: {coin}\n"
-            "· 之前金币: {prev_coin}\n"
-            "----------------------------"
-        )
+    def __init__(self, username, password, last_coins=None):
+        self.session = client.new_session()
+        self.username = username
+        self.password = password
+        # 账号较多时汇总报告按每个账号一行输出
+        self.result_template = "{status} · {username} · 金币 {coin}（之前 {prev_coin}）"
         self.current_coin = None
+        self.prev_coin = self.previous_coin(last_coins or {})
     
+    @property
+    def account_key(self):
+        return f"{self.platform}:{self.username}"
+
+    def previous_coin(self, last_coins):
+        """上次记录的金币；兼容旧版按平台记录的数据"""
+        return last_coins.get(self.account_key) or last_coins.get(self.platform)
+
+    def remember_login(self):
+        self.cookie_store.save(self.account_key, self.session)
+
     @classmethod
     def load_last_coins(cls):
-        try:
-            with open(cls.LAST_COINS_FILE, 'r') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {}
+        coins = store.load_json(cls.LAST_COINS_FILE, default=False)
+        if coins is False:
+            return store.load_json(cls.LEGACY_LAST_COINS_FILE)
+        return coins
     
     @classmethod
     def save_last_coins(cls, coins_data):
-        with open(cls.LAST_COINS_FILE, 'w') as f:
-            json.dump(coins_data, f, indent=2)
+        store.save_json(cls.LAST_COINS_FILE, coins_data)
     
-    def send_wecom_message(self, content):
+    @classmethod
+    def update_last_coins(cls, current_coins):
+        """加锁合并写入本次获取到的金币（按 平台:账号 记录），避免并发读改写互相覆盖"""
+        with store.file_lock(cls.LAST_COINS_FILE):
+            last_coins = cls.load_last_coins()
+            for (platform, account_key), coin in current_coins.items():
+                if coin and isinstance(coin, str) and coin.isdigit():
+                    last_coins[account_key] = coin
+                    # 旧版按平台记录的金币已迁移到账号下
+                    last_coins.pop(platform, None)
+            cls.save_last_coins(last_coins)
+
+# Discuz 站点配置：新增站点只需在此追加，或通过环境变量 ZHQD_SITES 传入同样结构的 JSON 列表
+# - user_env/pass_env：账号密码所在的环境变量
+# - credit：要统计的积分名称（与站点积分设置中的名称一致）
+# - sign：签到插件（k_misign），为空表示每日登录即签到
+# - password_md5：登录时提交密码的 MD5
+DISCUZ_SITES = [
+    {
+        "platform": "传世单机社区",
+        "base": "https://www.wooolc.com",
+        "user_env": "WOOOLCZ",
+        "pass_env": "WOOOLM",
+        "credit": "传世币",
+        "sign": "k_misign",
+    },
+    {
+        "platform": "游戏藏宝湾",
+        "base": "https://www.iopq.net",
+        "user_env": "WYDJZ",
+        "pass_env": "WYDJM1",
+        "credit": "金币",
+    },
+    {
+        "platform": "零度网游单机",
+        "base": "https://www.0du.net",
+        "user_env": "WYDJZ",
+        "pass_env": "WYDJM",
+        "credit": "金币",
+        "password_md5": True,
+    },
+    {
+        "platform": "热血侠网游单机",
+        "base": "http://www.rexuexia.com",
+        "user_env": "WYDJZ",
+        "pass_env": "WYDJM",
+        "credit": "金币",
+    },
+]
+
+def load_sites():
+    return DISCUZ_SITES + json.loads(os.getenv("ZHQD_SITES") or "[]")
+
+def load_accounts(config):
+    """读取站点的账号列表（多个账号用 | 分隔），返回 [(账号, 密码)]"""
+    usernames = os.getenv(config["user_env"], "")
+    passwords = os.getenv(config["pass_env"], "")
+    if not usernames or not passwords:
+        return []
+    usernames, passwords = usernames.split("|"), passwords.split("|")
+    if len(usernames) != len(passwords):
+        raise ValueError(f"账号密码数量不匹配（用户：{len(usernames)} 个，密码：{len(passwords)} 个）")
+    return [(u.strip(), p.strip()) for u, p in zip(usernames, passwords)]
+
+FORMHASH_INPUT = re.compile(r'name="formhash" value="(\w+)"')
+# 登录页只需 formhash 隐藏域，找到即停止读取；最多读取的字节数
+LOGIN_PAGE_SCAN_LIMIT = 128 * 1024
+
+def parse_formhash(text):
+    """从页面中取 formhash（表单隐藏域或链接参数）"""
+    match = FORMHASH_INPUT.search(text) or re.search(r"formhash=(\w+)", text)
+    return match.group(1) if match else None
+
+def find_formhash_input(text):
+    match = FORMHASH_INPUT.search(text)
+    return match.group(1) if match else None
+
+@functools.lru_cache(maxsize=None)
+def credit_extractor(credit):
+    """积分页中按积分名取值；积分名与数值之间可能隔着标签（如 <em>金币: </em>42），直接在页面源码中匹配"""
+    return extract.Extractor([
+        extract.Field('coin', rf"{re.escape(credit)}\s*[:：]\s*(?:<[^>]+>\s*)*(\d+)")
+    ])
+
+def parse_uid(text):
+    match = re.search(r"discuz_uid\s*=\s*'(\d+)'", text)
+    return match.group(1) if match else '0'
+
+class DiscuzSigner(BaseSigner):
+    """按站点配置执行 Discuz 登录、签到与积分查询
+
+    登录状态、formhash 与积分优先通过移动端接口（api/mobile module=profile）一次取得；
+    登录后的 formhash 直接取自登录响应，不再单独请求签到页
+    """
+    PROFILE_API = "/api/mobile/index.php?version=4&module=profile"
+
+    def __init__(self, config, username, password, last_coins=None):
+        self.config = config
+        self.base = config["base"].rstrip("/")
+        self.platform = config["platform"]
+        super().__init__(username, password, last_coins)
+        self.logged_user = None
+        self.formhash = None
+        # 最近一次登录状态下的接口数据，签到前后积分不变时直接复用
+        self.profile = None
+        # 定时模式下限制同时登录的账号数（见 run_platform）
+        self.login_slots = None
+
+    @property
+    def host(self):
+        return urlparse(self.base).hostname
+
+    def _profile(self, phase='info'):
+        """请求移动端个人资料接口，返回 Variables；接口不可用时返回 None"""
+        response = client.get(self.session, self.base + self.PROFILE_API, phase=phase)
         try:
-            corpid = os.getenv("WECOM_CORPID")
-            corpsecret = os.getenv("WECOM_SECRET")
-            agentid = os.getenv("WECOM_AGENTID")
-            
-            if not all([corpid, corpsecret, agentid]):
-                return False
-
-            token_url = f"https://qyapi.weixin.qq.com/cgi-bin/gettoken?corpid={corpid}&corpsecret={corpsecret}"
-            token_res = requests.get(token_url, timeout=10)
-            token_res.raise_for_status()
-            access_token = token_res.json().get("access_token")
-            
-            send_url = f"https://qyapi.weixin.qq.com/cgi-bin/message/send?access_token={access_token}"
-            payload = {
-                "touser": "@all",
-                "msgtype": "text",
-                "agentid": agentid,
-                "text": {"content": f"【全平台签到汇总】\n{content}"}
-            }
-            
-            send_res = requests.post(send_url, json=payload, timeout=10)
-            return send_res.json().get("errcode") == 0
-        except Exception as e:
-            logger.error(f"企业微信通知失败: {str(e)}")
+            variables = response.json()["Variables"]
+        except (ValueError, KeyError, TypeError):
+            return None
+        self.formhash = variables.get("formhash") or self.formhash
+        if str(variables.get("member_uid", "0")) != "0":
+            self.logged_user = variables.get("member_username") or self.logged_user
+            self.profile = variables
+        return variables
+
+    def _restore_login(self):
+        """恢复保存的登录态并验证，有效时返回 True"""
+        if not self.cookie_store.restore(self.account_key, self.session):
             return False
+        try:
+            variables = self._profile(phase='login')
+            if variables is None:
+                # 站点未开放移动端接口，用积分页验证
+                page = client.get(self.session, self.base + "/home.php?mod=spacecp&ac=credit&op=base", phase='login')
+                self.formhash = parse_formhash(page.text)
+                logged_in = parse_uid(page.text) != '0'
+            else:
+                logged_in = str(variables.get("member_uid", "0")) != "0"
+            if logged_in:
+                logger.info(f"{self.platform} {self.username} 复用保存的登录态")
+                return True
+        except Exception as e:
+            logger.warning(f"{self.platform} {self.username} 登录态验证失败: {str(e)}")
+        logger.info(f"{self.platform} {self.username} 保存的登录态已失效，重新登录")
+        self.cookie_store.discard(self.account_key, self.session)
+        self.formhash = None
+        return False
 
-class WooolcSigner(BaseSigner):
-    def __init__(self):
-        super().__init__()
-        self.username = os.getenv("WOOOLCZ")
-        self.password = os.getenv("WOOOLM")
-        self.platform = "传世单机社区"
-        self.logged_user = None
-        
     def _login(self):
-        try:
-            response = self.session.get(
-                "https://www.wooolc.com/member.php?mod=logging&action=login",
-                headers=self.headers,
-                timeout=10
+        """登录；登录前的 formhash 取自接口（同时获得 saltkey），不可用时取登录页"""
+        if not self.formhash and self._profile(phase='login') is None:
+            _, self.formhash = client.scan(
+                self.session, self.base + "/member.php?mod=logging&action=login", find_formhash_input,
+                phase='login', max_bytes=LOGIN_PAGE_SCAN_LIMIT
             )
-            doc = pq(response.text)
-            params = {
-                "formhash": doc('input[name="formhash"]').attr("value"),
-                "referer": doc('input[name="referer"]').attr("value") or "https://www.wooolc.com/forum.php",
-                "loginhash": re.search(r"loginhash=(\w+)", response.text).group(1),
-                "loginfield": doc('select[name="loginfield"] option[selected]').attr("value") or "username"
-            }
-            
-            login_url = f"https://www.wooolc.com/member.php?mod=logging&action=login&loginsubmit=yes&loginhash={params['loginhash']}&inajax=1"
-            data = {
-                "formhash": params["formhash"],
-                "referer": params["referer"],
-                "loginfield": params["loginfield"],
+        password = self.password
+        if self.config.get("password_md5"):
+            password = hashlib.md5(password.encode()).hexdigest()
+
+        response = self.session.post(
+            self.base + "/member.php?mod=logging&action=login&loginsubmit=yes",
+            data={
+                "formhash": self.formhash or "",
+                "referer": self.base + "/",
+                "loginfield": "username",
                 "username": self.username,
-                "password": self.password,
+                "password": password,
                 "questionid": "0",
                 "answer": "",
-                "cookietime": "2592000"
-            }
-            
-            response = self.session.post(login_url, data=data, headers=self.headers)
-            root = ET.fromstring(response.text)
-            cdata = root.text
-            
-            if "succeedhandle_" in cdata:
-                self.logged_user = self.username
-                self.session.get(re.search(r"window.location.href ='(.*?)';", cdata).group(1))
-                return True
-            raise ValueError(re.search(r"<error>(.*?)</error>", cdata).group(1))
-        except Exception as e:
-            logger.error(f"登录失败: {str(e)}")
+                "cookietime": "2592000",
+                "loginsubmit": "true",
+            },
+            timeout=client.timeout('login')
+        )
+        if parse_uid(response.text) == '0':
             return False
-    
-    def sign(self):
-        try:
-            start_time = datetime.now()
-            status = ""
-            coin = ""
-            prev_coins = self.load_last_coins()
-            prev_coin = prev_coins.get(self.platform, "未知")
-            
-            if not self._login():
-                status = "❌ 登录失败"
-            else:
-                formhash = self._get_formhash()
-                if not formhash:
-                    status = "⏰ 今日已签到"
-                else:
-                    response = self.session.post(
-                        "https://www.wooolc.com/plugin.php?id=k_misign:sign",
-                        data={"operation": "qiandao", "formhash": formhash, "format": "empty"},
-                        headers=self.headers
-                    )
-                    
-                    if "<root><![CDATA[]]></root>" in response.text:
-                        status = "✅ 签到成功"
-                    else:
-                        status = "⏰ 今日已签到"
-                
-                coin = self._get_coin() or "获取失败"
-                self.current_coin = coin if coin != "获取失败" else None
+        # 登录响应页面中已带有登录后的 formhash
+        self.formhash = parse_formhash(response.text) or self.formhash
+        username_match = re.search(r'欢迎您回来，(.+?)，', response.text)
+        self.logged_user = username_match.group(1) if username_match else self.logged_user
+        return True
 
-            return self.result_template.format(
-                time=start_time.strftime('%Y-%m-%d %H:%M:%S'),
-                status=status,
-                username=self.logged_user or self.username,
-                coin=f"{coin}枚",
-                prev_coin=f"{prev_coin}枚" if prev_coin != "未知" else "未知"
+    def _k_misign(self):
+        """k_misign 签到插件；定时模式下在重置时刻发出"""
+        send = lambda: self.session.post(
+            self.base + "/plugin.php?id=k_misign:sign",
+            data={"operation": "qiandao", "formhash": self.formhash, "format": "empty"},
+            timeout=client.timeout('sign')
+        )
+        reset = timing.pending_reset()
+        skew = None
+        if reset:
+            response, skew = timing.fire_at(
+                reset, self.session, self.base + "/", send,
+                keepalive=lambda: self.session.request('HEAD', self.base + "/forum.php")
             )
-        except Exception as e:
-            return f"‼️ 程序执行异常：{str(e)}"
-    
-    def _get_formhash(self):
-        try:
-            response = self.session.get("https://www.wooolc.com/plugin.php?id=k_misign:sign")
-            return pq(response.text)('input[name="formhash"]').attr("value")
-        except:
-            return None
-    
+        else:
+            response = send()
+        status = "✅ 签到成功" if "<root><![CDATA[]]></root>" in response.text else "⏰ 今日已签到"
+        return f"{status}（重置偏差 {skew}）" if skew else status
+
     def _get_coin(self):
-        try:
-            response = self.session.get("https://www.wooolc.com/home.php?mod=spacecp&ac=credit")
-            for li in pq(response.text)('li').items():
-                if '传世币' in li.text():
-                    match = re.search(r'传世币[：:]\s*(\d+)', li.text())
-                    return match.group(1) if match else None
-            return None
-        except Exception as e:
-            logger.error(f"获取金币失败: {str(e)}")
-            return None
+        """从接口返回的积分中按名称取值，接口不可用时解析积分页"""
+        variables = self.profile or self._profile()
+        if variables is not None:
+            for key, credit in (variables.get("extcredits") or {}).items():
+                if credit.get("title") == self.config["credit"]:
+                    return str((variables.get("space") or {}).get(f"extcredits{key}", "")) or None
+        response = client.get(self.session, self.base + "/home.php?mod=spacecp&ac=credit&op=base", hedge=True)
+        return credit_extractor(self.config["credit"]).extract(response.text, name='discuz_credit').get('coin')
 
-class IopqSigner(BaseSigner):
-    def __init__(self):
-        super().__init__()
-        self.username = os.getenv("WYDJZ")
-        self.password = os.getenv("WYDJM1")
-        self.platform = "游戏藏宝湾"
-        self.logged_user = None
-        
     def sign(self):
         try:
-            start_time = datetime.now()
-            status = ""
             coin = ""
-            prev_coins = self.load_last_coins()
-            prev_coin = prev_coins.get(self.platform, "未知")
-            
-            login_page = self.session.get('https://www.iopq.net/member.php?mod=logging&action=login')
-            soup = BeautifulSoup(login_page.text, 'html.parser')
-            formhash = soup.find('input', {'name': 'formhash'})['value']
-            
-            login_data = {
-                'formhash': formhash,
-                'referer': 'https://www.iopq.net/thread-17134279-1-1.html',
-                'username': self.username,
-                'password': self.password,
-                'questionid': '0',
-                'answer': '',
-                'cookietime': '2592000',
-                'loginsubmit': 'true'
-            }
-            
-            response = self.session.post(
-                'https://www.iopq.net/member.php?mod=logging&action=login&loginsubmit=yes&loginhash=LNmQo&inajax=1',
-                data=login_data
-            )
-            
-            if '欢迎您回来' not in response.text:
+
+            with self.login_slots or contextlib.nullcontext():
+                logged_in = self._restore_login() or self._login()
+            if not logged_in:
                 status = "❌ 登录失败"
             else:
-                username_match = re.search(r'欢迎您回来，(.*?)，', response.text)
-                self.logged_user = username_match.group(1) if username_match else self.username
-                status = "✅ 签到成功"
-                
-                credit_page = self.session.get('https://www.iopq.net/home.php?mod=spacecp&ac=credit&showcredit=1')
-                soup = BeautifulSoup(credit_page.text, 'html.parser')
-                gold_element = soup.find('em', string=re.compile(r'^\s*金币:\s*$'))
-                
-                if gold_element:
-                    li_text = gold_element.find_parent('li').get_text(strip=True)
-                    match = re.search(r'金币:\s*(\d+)', li_text)
-                    coin = match.group(1) if match else None
+                self.remember_login()
+                if self.config.get("sign") == "k_misign":
+                    status = self._k_misign()
+                    self.profile = None
                 else:
-                    coin = None
-                
-                self.current_coin = coin if coin else None
+                    # 每日登录奖励在当天首次访问时发放
+                    status = "✅ 签到成功"
+                coin = self._get_coin()
+                self.current_coin = coin
                 coin = coin or "获取失败"
 
             return self.result_template.format(
-                time=start_time.strftime('%Y-%m-%d %H:%M:%S'),
                 status=status,
-                username=self.logged_user,
-                coin=f"{coin}枚",
-                prev_coin=f"{prev_coin}枚" if prev_coin != "未知" else "未知"
+                username=self.logged_user or self.username,
+                coin=coin,
+                prev_coin=self.prev_coin or "未知"
             )
         except Exception as e:
             return f"‼️ 程序执行异常：{str(e)}"
 
-class OduSigner(BaseSigner):
-    def __init__(self):
-        super().__init__()
-        self.username = os.getenv("WYDJZ")
-        self.password = os.getenv("WYDJM")
-        self.platform = "零度网游单机"
-        self.logged_user = None
-        
-    def sign(self):
-        try:
-            start_time = datetime.now()
-            status = ""
-            coin = ""
-            prev_coins = self.load_last_coins()
-            prev_coin = prev_coins.get(self.platform, "未知")
-            
-            login_page = self.session.get('https://www.0du.net/member.php?mod=logging&action=login')
-            soup = BeautifulSoup(login_page.text, 'html.parser')
-            formhash = soup.find('input', {'name': 'formhash'})['value']
-            
-            login_data = {
-                'formhash': formhash,
-                'referer': 'https://www.0du.net/forum.php',
-                'username': self.username,
-                'password': hashlib.md5(self.password.encode()).hexdigest(),
-                'questionid': '0',
-                'answer': '',
-                'cookietime': '2592000',
-                'loginsubmit': 'true'
-            }
-            
-            response = self.session.post(
-                'https://www.0du.net/member.php?mod=logging&action=login&loginsubmit=yes&loginhash=LrtAc&inajax=1',
-                data=login_data
-            )
-            
-            username_match = re.search(r'欢迎您回来，(.+?)，', response.text)
-            if not username_match:
-                status = "❌ 登录失败"
-            else:
-                self.logged_user = username_match.group(1)
-                status = "✅ 签到成功"
-                
-                profile_page = self.session.get('https://www.0du.net/home.php?mod=space')
-                soup = BeautifulSoup(profile_page.text, 'html.parser')
-                gold_element = soup.find('li', class_='nexmemberinfosthrees').find('p')
-                coin = gold_element.text.strip() if gold_element else None
-                self.current_coin = coin if coin else None
-                coin = coin or "获取失败"
+# 所有平台签到的整体截止时间（秒）
+SIGN_DEADLINE = int(os.getenv("ZHQD_DEADLINE", "300"))
+# 每个平台同时签到的账号数上限，避免同一论坛短时间内大量并发登录
+PLATFORM_WORKERS = int(os.getenv("ZHQD_PLATFORM_WORKERS", "4"))
 
-            return self.result_template.format(
-                time=start_time.strftime('%Y-%m-%d %H:%M:%S'),
-                status=status,
-                username=self.logged_user,
-                coin=f"{coin}枚",
-                prev_coin=f"{prev_coin}枚" if prev_coin != "未知" else "未知"
-            )
-        except Exception as e:
-            return f"‼️ 程序执行异常：{str(e)}"
+def run_signer(signer):
+    """在独立工作线程中执行单个账号签到，返回 (报告内容, 是否成功, 当前金币)"""
+    try:
+        logger.info(f"=== 开始执行 {signer.platform} {signer.username} 签到 ===")
+        result = signer.sign()
+        ok = not any(mark in result for mark in ("❌", "‼️"))
+        return result, ok, signer.current_coin
+    except Exception as e:
+        logger.error(f"{signer.platform} {signer.username} 执行异常: {str(e)}")
+        return f"‼️ {signer.username} 执行异常 {str(e)}", False, None
 
-class RexuexiaSigner(BaseSigner):
-    def __init__(self):
-        super().__init__()
-        self.username = os.getenv("WYDJZ")
-        self.password = os.getenv("WYDJM")
-        self.platform = "热血侠网游单机"
-        self.logged_user = None
-        
-    def sign(self):
-        try:
-            start_time = datetime.now()
-            status = ""
-            coin = ""
-            prev_coins = self.load_last_coins()
-            prev_coin = prev_coins.get(self.platform, "未知")
-            
-            login_page = self.session.get('http://www.rexuexia.com/member.php?mod=logging&action=login')
-            soup = BeautifulSoup(login_page.text, 'html.parser')
-            formhash = soup.find('input', {'name': 'formhash'})['value']
-            
-            login_data = {
-                'formhash': formhash,
-                'referer': 'http://www.rexuexia.com/',
-                'username': self.username,
-                'password': self.password,
-                'questionid': 0,
-                'cookietime': 2592000,
-                'loginsubmit': 'true'
-            }
-            
-            response = self.session.post(
-                'http://www.rexuexia.com/member.php?mod=logging&action=login&loginsubmit=yes&loginhash=LDefault&inajax=1',
-                data=login_data
-            )
-            
-            credit_page = self.session.get('http://www.rexuexia.com/home.php?mod=spacecp&ac=credit&op=base')
-            soup = BeautifulSoup(credit_page.text, 'html.parser')
-            self.logged_user = soup.select_one('div.deanavartop a[title]')['title']
-            
-            gold_element = soup.find('li', class_='xi1')
-            if gold_element:
-                gold_text = gold_element.get_text(strip=True)
-                coin = gold_text.split('金币:')[-1].split()[0]
-                self.current_coin = coin
-                status = "✅ 签到成功"
-            else:
-                coin = "获取失败"
-                self.current_coin = None
-                status = "⚠️ 金币获取失败"
+def run_platform(config, last_coins, deadline_at):
+    """按平台的并发上限签到该平台所有账号，返回 (平台汇总行, [(签到器, 结果)])"""
+    try:
+        accounts = load_accounts(config)
+    except ValueError as e:
+        return f"❌ {config['platform']}：{str(e)}", []
+    if not accounts:
+        return f"{config['platform']}：未配置账号密码", []
 
-            return self.result_template.format(
-                time=start_time.strftime('%Y-%m-%d %H:%M:%S'),
-                status=status,
-                username=self.logged_user,
-                coin=f"{coin}枚",
-                prev_coin=f"{prev_coin}枚" if prev_coin != "未知" else "未知"
-            )
-        except Exception as e:
-            return f"‼️ 程序执行异常：{str(e)}"
+    signers = [DiscuzSigner(config, u, p, last_coins) for u, p in accounts]
+    requests_before = client.stats[signers[0].host]
+    timeout = max(0, deadline_at - time.time())
+    workers = PLATFORM_WORKERS
+    if timing.pending_reset():
+        # 定时模式：所有账号提前就位等待重置时刻，仅登录阶段按 PLATFORM_WORKERS 限制并发
+        workers = len(signers)
+        login_slots = threading.BoundedSemaphore(PLATFORM_WORKERS)
+        for signer in signers:
+            signer.login_slots = login_slots
+    results = runner.run_all(
+        run_signer,
+        [(signer,) for signer in signers],
+        workers=workers,
+        timeout=timeout,
+        on_timeout=lambda signer: (f"❌ {signer.username} 执行超时（超过 {timeout:.0f} 秒）", False, None)
+    )
+
+    succeeded = total = gained = 0
+    for signer, (_, ok, coin) in zip(signers, results):
+        succeeded += ok
+        if coin and coin.isdigit():
+            total += int(coin)
+            if signer.prev_coin and signer.prev_coin.isdigit():
+                gained += int(coin) - int(signer.prev_coin)
+    round_trips = client.stats[signers[0].host] - requests_before
+    summary = (
+        f"{'✅' if succeeded == len(signers) else '⚠️'} {config['platform']}："
+        f"成功 {succeeded}/{len(signers)} · 金币合计 {total}（{gained:+d}）"
+        f" · 平均每账号请求 {round_trips / len(signers):.1f} 次"
+    )
+    return summary, list(zip(signers, results))
 
 def main():
-    signers = [
-        WooolcSigner(),
-        IopqSigner(),
-        OduSigner(),
-        RexuexiaSigner()
-    ]
-    
-    report = []
-    current_coins = {}
-    
-    for signer in signers:
-        try:
-            if not signer.username or not signer.password:
-                report.append(f"{signer.platform}: 未配置账号密码")
-                continue
-            
-            logger.info(f"=== 开始执行 {signer.platform} 签到 ===")
-            result = signer.sign()
-            
-            if hasattr(signer, 'platform') and hasattr(signer, 'current_coin'):
-                current_coins[signer.platform] = signer.current_coin
-            
-            report.append(f"{signer.platform}签到结果：\n{result}")
-            time.sleep(random.randint(1, 3))
-        except Exception as e:
-            report.append(f"{signer.platform}: 执行异常 {str(e)}")
-            logger.error(f"{signer.platform} 执行异常: {str(e)}")
-    
+    sites = load_sites()
     last_coins = BaseSigner.load_last_coins()
-    for platform, coin in current_coins.items():
-        if coin and isinstance(coin, str) and coin.isdigit():
-            last_coins[platform] = coin
-    BaseSigner.save_last_coins(last_coins)
-    
-    final_content = "\n\n".join(report)
-    logger.info("\n" + final_content)
-    
-    if BaseSigner().send_wecom_message(final_content):
-        logger.info("通知发送成功")
+
+    # 定时模式下截止时间顺延到重置时刻之后
+    reset = timing.pending_reset()
+    deadline = SIGN_DEADLINE + (max(0, reset - time.time()) if reset else 0)
+    deadline_at = time.time() + deadline
+
+    # 各平台互不相关，并发签到；平台内按 PLATFORM_WORKERS 限制并发，超过截止时间仍未完成的账号记为超时
+    platforms = runner.run_all(
+        run_platform,
+        [(config, last_coins, deadline_at) for config in sites],
+        workers=len(sites)
+    )
+
+    report = wecom.Report("【全平台签到汇总】")
+    report.add_header(f"⏰ 执行时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    current_coins = {}
+    for config, (summary, results) in zip(sites, platforms):
+        report.add_header(summary)
+        for signer, (content, ok, coin) in results:
+            report.add(f"[{signer.platform}] {content}", ok=ok)
+            current_coins[(signer.platform, signer.account_key)] = coin
+
+    BaseSigner.update_last_coins(current_coins)
+
+    logger.info(f"\n{report}")
+
+    if not all(wecom.get_config()):
+        logger.warning("企业微信配置不完整，跳过通知")
+    elif wecom.notify(report, source='zhqd'):
+        logger.info("通知已加入发送队列")
     else:
-        logger.warning("通知发送失败")
+        logger.warning("通知入队失败")
 
 if __name__ == "__main__":
     main()